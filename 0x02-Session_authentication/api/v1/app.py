@@ -5,14 +5,17 @@ Route module for the API
 import os
 from os import getenv
 
-from flask import Flask, abort, jsonify, request
+from flask import Flask, abort, g, jsonify, request
 from flask_cors import CORS, cross_origin
 
 from api.v1.auth.auth import Auth
 from api.v1.auth.basic_auth import BasicAuth
+from api.v1.auth.context import AuthContext
+from api.v1.auth.path_matcher import PathMatcher
 from api.v1.auth.session_auth import SessionAuth
 from api.v1.auth.session_db_auth import SessionDBAuth
 from api.v1.auth.session_exp_auth import SessionExpAuth
+from api.v1.auth.session_token_auth import SessionTokenAuth
 from api.v1.views import app_views
 
 app = Flask(__name__)
@@ -32,6 +35,18 @@ if AUTH_TYPE == "session_exp_auth":
     auth = SessionExpAuth()
 if AUTH_TYPE == "session_db_auth":
     auth = SessionDBAuth()
+if AUTH_TYPE == "session_token_auth":
+    auth = SessionTokenAuth()
+app.extensions["auth"] = auth
+
+EXCLUDED_PATHS = PathMatcher(
+    [
+        "/api/v1/status/",
+        "/api/v1/unauthorized/",
+        "/api/v1/forbidden/",
+        "/api/v1/auth_session/login/",
+    ]
+)
 
 
 @app.before_request
@@ -47,20 +62,16 @@ def filtering_request():
     if auth is None:
         return
 
-    excluded_paths = [
-        "/api/v1/status/",
-        "/api/v1/unauthorized/",
-        "/api/v1/forbidden/",
-        "/api/v1/auth_session/login/",
-    ]
-    if auth.require_auth(request.path, excluded_paths):
-        cookie = auth.session_cookie(request)
-        if not auth.authorization_header(request) and not cookie:
+    # The user is resolved once per request, then reused by the views
+    context = AuthContext(auth, request)
+    g.auth_context = context
+    if auth.require_auth(request.path, EXCLUDED_PATHS):
+        if not auth.authorization_header(request) and not context.session_id:
             return None, abort(401)
-        if auth.current_user(request) is None:
+        if context.user is None:
             return None, abort(403)
 
-    setattr(request, "current_user", auth.current_user(request))
+    setattr(request, "current_user", context.user)
 
 
 @app.errorhandler(401)
@@ -6,10 +6,12 @@ Class that provides authentication and authorization functionality
 """
 
 from os import getenv
-from typing import List, TypeVar
+from typing import List, TypeVar, Union
 
 from flask import request
 
+from api.v1.auth.path_matcher import PathMatcher
+
 SESSION_NAME = getenv("SESSION_NAME")
 
 
@@ -18,25 +20,21 @@ class Auth:
     This class provides authentication and authorization functionality.
     """
 
-    def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
+    def require_auth(
+        self, path: str, excluded_paths: Union[List[str], PathMatcher]
+    ) -> bool:
         """
         Checks if authentication is required for the given path
+
+        `excluded_paths` is best compiled once into a PathMatcher; a list
+        is compiled on each call.
         """
         if not path or not excluded_paths or not len(excluded_paths):
             return True
 
-        for excluded_path in excluded_paths:
-            if excluded_path.endswith("*"):
-                if path.startswith(excluded_path[:-1]):
-                    return False
-            elif (
-                path == excluded_path
-                or path == excluded_path.rstrip("/")
-                or "".join([path, "/"]) == excluded_path
-            ):
-                return False
-
-        return True
+        if not isinstance(excluded_paths, PathMatcher):
+            excluded_paths = PathMatcher(excluded_paths)
+        return not excluded_paths.match(path)
 
     def authorization_header(self, request=None) -> str:
         """
@@ -58,6 +56,36 @@ class Auth:
         """
         return None
 
+    def user_sessions(self, user_id: str) -> list:
+        """
+        Lists the sessions of a user.
+
+        Returns None: there are no sessions here.
+        """
+        return None
+
+    def destroy_user_sessions(self, user_id: str) -> int:
+        """
+        Destroys every session of a user.
+
+        Returns None: there are no sessions here.
+        """
+        return None
+
+    def stats(self) -> dict:
+        """
+        Retrieves the counters of the authentication.
+        """
+        return {}
+
+    def session_metrics(self) -> dict:
+        """
+        Retrieves the metrics of the sessions.
+
+        Returns None: there are no sessions here.
+        """
+        return None
+
     def session_cookie(self, request=None):
         """
         Retrieves the session cookie from the request.
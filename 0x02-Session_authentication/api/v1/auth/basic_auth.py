@@ -3,15 +3,43 @@
 """Basic auth"""
 
 import base64
+from os import getenv
 from typing import Tuple, TypeVar
 
 from api.v1.auth.auth import Auth
+from api.v1.auth.credential_cache import CredentialCache
+from api.v1.auth.single_flight import SingleFlight
+from api.v1.auth.throttle import FailureThrottle
 from models.user import User
 
 
 class BasicAuth(Auth):
     """Basic auth"""
 
+    # A client address is charged this fraction of a token per failure,
+    # so it can fail for ADDRESS_FAILURE_RATIO more emails than one email
+    ADDRESS_FAILURE_RATIO = 10
+
+    def __init__(self):
+        """
+        Initializes the cache of verified credentials, sized by
+        BASIC_AUTH_CACHE_SIZE (entries, 0 to disable) and
+        BASIC_AUTH_CACHE_TTL (seconds), and the throttle of failed
+        checks, set by BASIC_AUTH_THROTTLE_BURST (failures, 0 to disable),
+        BASIC_AUTH_THROTTLE_RATE (failures per second) and
+        BASIC_AUTH_THROTTLE_KEYS (clients remembered).
+        """
+        self.credential_cache = CredentialCache(
+            max_size=int(getenv("BASIC_AUTH_CACHE_SIZE", "1024")),
+            ttl=float(getenv("BASIC_AUTH_CACHE_TTL", "60")),
+        )
+        self.throttle = FailureThrottle(
+            burst=float(getenv("BASIC_AUTH_THROTTLE_BURST", "5")),
+            rate=float(getenv("BASIC_AUTH_THROTTLE_RATE", "0.2")),
+            max_keys=int(getenv("BASIC_AUTH_THROTTLE_KEYS", "10000")),
+        )
+        self.single_flight = SingleFlight()
+
     def extract_base64_authorization_header(self, auth_header: str) -> str:
         """
         Extracts the base64 authorization header from the
@@ -126,9 +154,57 @@ class BasicAuth(Auth):
         if not auth_header:
             return
 
+        user = self.credential_cache.get(auth_header)
+        if user is not None:
+            return user
+
+        # Identical checks running at the same time share one verification
+        address = getattr(request, "remote_addr", None)
+        return self.single_flight.do(
+            (self.credential_cache.digest(auth_header), address),
+            lambda: self._verify(auth_header, address),
+        )
+
+    def _verify(self, auth_header: str, address: str) -> TypeVar("User"):
+        """
+        Verifies the credentials of an Authorization header.
+
+        Args:
+          auth_header (str): The Authorization header.
+          address (str): The address of the client.
+
+        Returns:
+          User: The user object if the credentials are valid, otherwise None.
+        """
         b64_auth = self.extract_base64_authorization_header(auth_header)
         dec_auth = self.decode_base64_authorization_header(b64_auth)
         email, password = self.extract_user_credentials(dec_auth)
+
+        # Clients failing too often are rejected before any search or hash
+        keys = ((address, email), address)
+        if not all(self.throttle.allow(key) for key in keys):
+            return None
+
         user = self.user_object_from_credentials(email, password)
+        if user is None:
+            self.throttle.failure(keys[0])
+            self.throttle.failure(keys[1], 1 / self.ADDRESS_FAILURE_RATIO)
+        else:
+            self.throttle.success(keys[0])
+            self.credential_cache.put(auth_header, user)
 
         return user
+
+    def stats(self) -> dict:
+        """
+        Retrieves the counters of the authentication.
+
+        Returns:
+          dict: The counters of the verified-credential cache, of the
+          throttle of failed checks and of the coalesced checks.
+        """
+        return {
+            "credential_cache": self.credential_cache.stats(),
+            "throttle": self.throttle.stats(),
+            "single_flight": self.single_flight.stats(),
+        }
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+"""Authentication state of the current request"""
+
+from typing import TypeVar
+
+from flask import g, has_app_context
+
+_MISSING = object()
+
+
+class AuthContext:
+    """
+    Authentication state of one request, resolved at most once.
+
+    The session cookie and the current user are looked up the first time
+    they are needed and then reused for the rest of the request, whether
+    by the request filter or by the views.
+    """
+
+    def __init__(self, auth, request):
+        """
+        Initializes the context of a request.
+
+        Args:
+          auth (Auth): The authentication in use.
+          request (Request): The request object.
+        """
+        self.auth = auth
+        self.request = request
+        self._session_id = _MISSING
+        self._user = _MISSING
+
+    @property
+    def session_id(self) -> str:
+        """
+        The session cookie of the request, or None.
+        """
+        if self._session_id is _MISSING:
+            self._session_id = self.auth.session_cookie(self.request)
+        return self._session_id
+
+    @property
+    def user(self) -> TypeVar("User"):  # type: ignore
+        """
+        The authenticated user of the request, or None.
+        """
+        if self._user is _MISSING:
+            self._user = self.auth.current_user(self.request)
+        return self._user
+
+    def forget(self):
+        """
+        Forgets the resolved state, e.g. after a logout.
+        """
+        self._session_id = _MISSING
+        self._user = _MISSING
+
+
+def auth_context() -> AuthContext:
+    """
+    Retrieves the authentication context of the current request.
+
+    Returns:
+      AuthContext: The context set by the request filter, or None when no
+      authentication is in use.
+    """
+    if not has_app_context():
+        return None
+    return g.get("auth_context")
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+"""Cache of verified Basic auth credentials"""
+
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from models.user import User
+
+
+class CredentialCache:
+    """
+    Bounded LRU cache mapping verified Authorization headers to user IDs.
+
+    Headers are never stored: entries are keyed by an HMAC of the header
+    with a random per-process key. An entry also remembers the email and
+    password digest the credentials were checked against, so a hit is only
+    served while the user still exists with the same email and password.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60.0):
+        """
+        Initialize an empty cache.
+
+        Args:
+          max_size (int): The maximum number of entries, 0 to disable.
+          ttl (float): The lifetime of an entry in seconds.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def digest(self, auth_header: str) -> bytes:
+        """
+        Keyed digest of an Authorization header.
+
+        Args:
+          auth_header (str): The Authorization header.
+
+        Returns:
+          bytes: The HMAC-SHA256 of the header.
+        """
+        return hmac.new(
+            self._key, auth_header.encode("utf-8"), hashlib.sha256
+        ).digest()
+
+    def get(self, auth_header: str) -> User:
+        """
+        Retrieves the user of verified credentials.
+
+        Args:
+          auth_header (str): The Authorization header.
+
+        Returns:
+          User: The user if the header was verified recently and the user
+          did not change since, otherwise None.
+        """
+        if not self.max_size or not isinstance(auth_header, str):
+            return None
+
+        digest = self.digest(auth_header)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+            user_id, email, password, expires_at = entry
+            if expires_at <= now:
+                del self._entries[digest]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+
+        user = User.get(user_id)
+        if (
+            user is None
+            or user.email != email
+            or user._password != password
+        ):
+            with self._lock:
+                if self._entries.pop(digest, None) is not None:
+                    self.invalidations += 1
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return user
+
+    def put(self, auth_header: str, user: User):
+        """
+        Remembers the user of verified credentials.
+
+        Args:
+          auth_header (str): The Authorization header.
+          user (User): The user the credentials belong to.
+        """
+        if not self.max_size or not isinstance(auth_header, str):
+            return
+
+        digest = self.digest(auth_header)
+        entry = (
+            user.id,
+            user.email,
+            user._password,
+            time.monotonic() + self.ttl,
+        )
+        with self._lock:
+            self._entries[digest] = entry
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Counters of the cache.
+
+        Returns:
+          dict: The size, hits, misses, hit rate, evictions and
+          invalidations of the cache.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""Matcher of the paths excluded from authentication"""
+
+from typing import Iterable
+
+
+class PathMatcher:
+    """
+    Set of excluded paths compiled once for fast matching.
+
+    A path matches an excluded path equal to it, to it with one trailing
+    slash added, or to it with all of its trailing slashes removed, as
+    `Auth.require_auth` always did: `/api/v1/status/` matches
+    `/api/v1/status` and `/api/v1/status/`, but `/api/v1/status` only
+    matches itself. A path ending with `*` matches every path starting with
+    what precedes the `*`. The forms of the exact paths are kept in a set
+    and prefixes in a trie, so matching costs O(len(path)) however many
+    paths are excluded.
+    """
+
+    def __init__(self, excluded_paths: Iterable[str] = ()):
+        """
+        Compiles the excluded paths.
+
+        Args:
+          excluded_paths (Iterable[str]): The excluded paths.
+        """
+        self.exact = set()
+        self.prefixes = {}
+        self._size = 0
+        for excluded_path in excluded_paths or ():
+            self.add(excluded_path)
+
+    def __len__(self) -> int:
+        """
+        Number of excluded paths.
+        """
+        return self._size
+
+    def add(self, excluded_path: str):
+        """
+        Adds an excluded path.
+
+        Args:
+          excluded_path (str): The path, or prefix when it ends with `*`.
+        """
+        if not excluded_path or not isinstance(excluded_path, str):
+            return
+        self._size += 1
+        if not excluded_path.endswith("*"):
+            self.exact.add(excluded_path)
+            self.exact.add(excluded_path.rstrip("/"))
+            if excluded_path.endswith("/"):
+                self.exact.add(excluded_path[:-1])
+            return
+
+        node = self.prefixes
+        for char in excluded_path[:-1]:
+            node = node.setdefault(char, {})
+        # None marks the end of a prefix
+        node[None] = True
+
+    def match(self, path: str) -> bool:
+        """
+        Checks if a path is excluded.
+
+        Args:
+          path (str): The path of the request.
+
+        Returns:
+          bool: True if the path is excluded, False otherwise.
+        """
+        if path in self.exact:
+            return True
+
+        node = self.prefixes
+        if not node:
+            return False
+        for char in path:
+            if None in node:
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+        return None in node
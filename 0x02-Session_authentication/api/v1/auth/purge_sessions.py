@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+"""
+Removes the expired sessions of SessionDBAuth.
+
+    $ SESSION_DURATION=3600 python3 -m api.v1.auth.purge_sessions
+
+Every UserSession created more than SESSION_DURATION seconds ago is
+removed in one pass, with one write of the storage.
+"""
+
+import argparse
+import sys
+import time
+from typing import List
+
+from api.v1.auth.session_db_auth import SessionDBAuth
+from models.user_session import UserSession
+
+
+def purge(duration: int = None, out=sys.stdout) -> int:
+    """
+    Removes the expired sessions and reports the size of the storage.
+
+    Args:
+      duration (int): The lifetime of a session in seconds, default
+      SESSION_DURATION.
+      out: The stream of the report.
+
+    Returns:
+      int: The number of sessions removed.
+    """
+    auth = SessionDBAuth()
+    if duration is not None:
+        auth.session_duration = duration
+    if auth.session_duration <= 0:
+        raise ValueError("Sessions never expire: the duration is not positive")
+
+    before = UserSession.stats()
+    start = time.perf_counter()
+    purged = auth.purge_expired()
+    elapsed = time.perf_counter() - start
+    after = UserSession.stats()
+    out.write(
+        "purged {} of {} sessions in {:.0f} ms, {} -> {} bytes\n".format(
+            purged,
+            before["objects"],
+            elapsed * 1000,
+            before["file_bytes"],
+            after["file_bytes"],
+        )
+    )
+    return purged
+
+
+def main(argv: List[str] = None) -> int:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(
+        prog="python3 -m api.v1.auth.purge_sessions",
+        description="Remove the expired sessions of session_db_auth",
+    )
+    parser.add_argument(
+        "--duration",
+        type=int,
+        help="lifetime of a session in seconds (default: SESSION_DURATION)",
+    )
+    args = parser.parse_args(argv)
+    try:
+        purge(args.duration)
+    except ValueError as e:
+        parser.error(str(e))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,16 +2,153 @@
 
 """Session auth class"""
 
+import logging
+import threading
+import time
+from os import getenv
+from typing import List, Tuple
 from uuid import uuid4
 
 from api.v1.auth.auth import Auth
+from api.v1.auth.session_metrics import SessionMetrics
+from api.v1.auth.session_store import (
+    Session,
+    epoch_second,
+    new_session_store,
+)
 from models.user import User
 
+logger = logging.getLogger(__name__)
+
 
 class SessionAuth(Auth):
-    """Session auth class"""
+    """Session auth class
+
+    Sessions are kept in the store selected by SESSION_STORE (see
+    `new_session_store`), in memory by default.
+
+    Creations, destructions and the latency of the session lookups of
+    `current_user` are recorded in `metrics`, read with `session_metrics`.
+    """
+
+    # Whether the store evicts records beyond the session limits
+    store_limits = True
+
+    def __init__(self):
+        """
+        Initializes the session store. Once a session is created, a
+        background thread removes the expired sessions from the store every
+        SESSION_EXPIRE_INTERVAL seconds (default 60, 0 to only evict them
+        when they are read).
+        """
+        self.store = new_session_store(self.store_limits)
+        self.expire_interval = float(getenv("SESSION_EXPIRE_INTERVAL", "60"))
+        self._sweeper = None
+        self._sweeper_lock = threading.Lock()
+        self.metrics = SessionMetrics()
+
+    def expire_sessions(self, now: float = None) -> int:
+        """
+        Removes the expired sessions from the store.
+
+        Args:
+          now (float): The current time, in seconds since the epoch.
+
+        Returns:
+          int: The number of sessions removed.
+        """
+        return self.store.expire(time.time() if now is None else now)
+
+    def _start_sweeper(self):
+        """
+        Starts the thread removing expired sessions if it is not running.
+        """
+        if self.expire_interval <= 0:
+            return
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        with self._sweeper_lock:
+            if self._sweeper is not None and self._sweeper.is_alive():
+                return
+            self._sweeper = threading.Thread(
+                target=self._sweep_loop, name="SessionAuth-sweep", daemon=True
+            )
+            self._sweeper.start()
 
-    user_id_by_session_id = {}
+    def _sweep_loop(self):
+        """
+        Removes expired sessions until the process exits.
+
+        The stores remove them in small batches, so requests are only
+        delayed by one batch at a time.
+        """
+        while True:
+            time.sleep(self.expire_interval)
+            try:
+                self.expire_sessions()
+            except Exception:
+                logger.exception("Removing expired sessions failed")
+
+    def stats(self) -> dict:
+        """
+        Retrieves the counters of the authentication.
+
+        Returns:
+          dict: The counters of the session store.
+        """
+        return {"session_store": self.store.stats()}
+
+    def session_metrics(self) -> dict:
+        """
+        Retrieves the metrics of the sessions.
+
+        Returns:
+          dict: The number and size of the sessions of the store, the
+          sessions created and destroyed, in total and per second over the
+          last minute, the lookups of expired sessions, and the histogram
+          of the lookup latencies.
+        """
+        store_stats = self.store.stats()
+        return self.metrics.snapshot(
+            store_stats["sessions"],
+            store_stats["bytes"],
+            store_stats["expired_gets"],
+        )
+
+    @property
+    def user_id_by_session_id(self) -> dict:
+        """
+        Snapshot of the user ID of every session.
+        """
+        return {
+            session_id: session.user_id
+            for session_id, session in self.store.items()
+        }
+
+    def expires_at(self, created_at: float) -> int:
+        """
+        Computes the expiration time of a new session.
+
+        Args:
+          created_at (float): The creation time, in seconds since the epoch.
+
+        Returns:
+          int: The expiration time, or None: sessions never expire.
+        """
+        return None
+
+    def seen(self, session_id: str, session: Session) -> bool:
+        """
+        Records a use of a session.
+
+        Args:
+          session_id (str): The session ID.
+          session (Session): The session.
+
+        Returns:
+          bool: True if the expiration of the session moved: never, here.
+        """
+        return False
 
     def create_session(self, user_id: str = None) -> str:
         """
@@ -28,8 +165,10 @@ class SessionAuth(Auth):
             return None
 
         session_id = str(uuid4())
-
-        self.user_id_by_session_id[session_id] = user_id
+        now = epoch_second(time.time())
+        self.store.set(session_id, Session(user_id, now, self.expires_at(now)))
+        self._start_sweeper()
+        self.metrics.created.add(now=now)
         return session_id
 
     def user_id_for_session_id(self, session_id: str = None) -> str:
@@ -47,8 +186,12 @@ class SessionAuth(Auth):
         if not session_id or not isinstance(session_id, str):
             return None
 
-        user_id = self.user_id_by_session_id.get(session_id)
-        return user_id
+        # The store evicts expired sessions instead of returning them
+        session = self.store.get(session_id)
+        if session is None:
+            return None
+        self.seen(session_id, session)
+        return session.user_id
 
     def current_user(self, request=None):
         """
@@ -63,11 +206,44 @@ class SessionAuth(Auth):
         """
 
         session_cookie = self.session_cookie(request)
+        start = time.perf_counter()
         user_id = self.user_id_for_session_id(session_cookie)
+        self.metrics.lookups.add(time.perf_counter() - start)
 
         user = User.get(user_id)
         return user
 
+    def user_sessions(self, user_id: str) -> List[Tuple[str, Session]]:
+        """
+        Lists the live sessions of a user, with the index of the store.
+
+        Args:
+          user_id (str): The ID of the user.
+
+        Returns:
+          List[Tuple[str, Session]]: The (session ID, session) pairs.
+        """
+        now = int(time.time())
+        return [
+            (session_id, session)
+            for session_id, session in self.store.user_sessions(user_id)
+            if session.expires_at is None or session.expires_at > now
+        ]
+
+    def destroy_user_sessions(self, user_id: str) -> int:
+        """
+        Destroys every session of a user, e.g. when it is deleted.
+
+        Args:
+          user_id (str): The ID of the user.
+
+        Returns:
+          int: The number of sessions destroyed.
+        """
+        destroyed = self.store.delete_user(user_id)
+        self.metrics.destroyed.add(destroyed)
+        return destroyed
+
     def destroy_session(self, request=None):
         """
         Destroy a session.
@@ -89,6 +265,7 @@ class SessionAuth(Auth):
         if not self.user_id_for_session_id(session_cookie):
             return False
 
-        del self.user_id_by_session_id[session_cookie]
-
+        if not self.store.delete(session_cookie):
+            return False
+        self.metrics.destroyed.add()
         return True
@@ -2,14 +2,195 @@
 
 """SessionDBAuth class"""
 
-from datetime import datetime, timedelta
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from os import getenv
+from typing import List, Tuple
 
 from api.v1.auth.session_exp_auth import SessionExpAuth
+from api.v1.auth.session_store import Session, epoch_second
+from models.base import TIMESTAMP_FORMAT
 from models.user_session import UserSession
 
+logger = logging.getLogger(__name__)
+
 
 class SessionDBAuth(SessionExpAuth):
-    """SessionDBAuth class"""
+    """SessionDBAuth class
+
+    Sessions are persisted as UserSession objects whose ID is the session
+    ID, so a session is read by ID instead of searched for. Older objects,
+    saved under another ID, are still found with a scan of the sessions,
+    until a scan finds none of them left.
+
+    The session store is a write-through cache of the UserSession objects:
+    sessions are added to and removed from both. A session found in the
+    cache is still checked by ID in the storage, which costs O(1), so a
+    session destroyed by another worker is never served.
+
+    With sliding expiration, the last use of a session is its updated_at.
+    Moving the expiration of a cached session (at most once per
+    SESSION_TOUCH_INTERVAL) queues its UserSession, and the queue is saved
+    in one write once per interval, so sessions used on every request do
+    not cost a write each.
+
+    The session limits of the store also apply to the UserSession objects,
+    which would otherwise bring evicted sessions back into the cache: a
+    user keeps at most SESSION_MAX_PER_USER of them (default 20), the
+    oldest being removed, and at most SESSION_MAX (default 100000) are
+    kept, the least recently used being removed. 0 is no limit.
+
+    Expired UserSession objects are removed by `purge_expired`, from the
+    command line (`python3 -m api.v1.auth.purge_sessions`) or every
+    SESSION_PURGE_INTERVAL seconds by the thread expiring the cache.
+    """
+
+    # Whether UserSession objects saved under another ID may be left
+    _legacy_sessions = True
+
+    def __init__(self) -> None:
+        """
+        Initializes a SessionDBAuth object. Expired UserSession objects
+        are purged every SESSION_PURGE_INTERVAL seconds (default 0: only
+        by the command), checked every SESSION_EXPIRE_INTERVAL seconds.
+        """
+        super().__init__()
+        self.purge_interval = float(getenv("SESSION_PURGE_INTERVAL", "0"))
+        self._purged_at = time.monotonic()
+        self._touched = {}
+        self._touch_lock = threading.Lock()
+        self._touches_saved_at = time.monotonic()
+        self.touch_writes = 0
+        self.max_sessions = int(getenv("SESSION_MAX", "100000"))
+        self.max_per_user = int(getenv("SESSION_MAX_PER_USER", "20"))
+
+    def seen(self, session_id: str, session: Session) -> bool:
+        """
+        Records a use of a session, queuing the save of its last use when
+        its sliding expiration moved.
+
+        Args:
+          session_id (str): The session ID.
+          session (Session): The session.
+
+        Returns:
+          bool: True if the expiration of the session moved.
+        """
+        if not super().seen(session_id, session):
+            return False
+        with self._touch_lock:
+            self._touched[session_id] = time.time()
+            due = (
+                time.monotonic() - self._touches_saved_at
+                >= self.touch_interval
+            )
+        if due:
+            self.save_touches()
+        return True
+
+    def save_touches(self) -> int:
+        """
+        Saves the last use of the queued sessions with one write of the
+        storage.
+
+        Returns:
+          int: The number of UserSession objects saved.
+        """
+        with self._touch_lock:
+            touched, self._touched = self._touched, {}
+            self._touches_saved_at = time.monotonic()
+
+        user_sessions = []
+        for session_id, seen_at in touched.items():
+            user_session = self._user_session(session_id)
+            if user_session is None:
+                continue
+            # A copy: the object of the storage is only replaced by saving
+            obj_json = user_session.to_json(True)
+            obj_json["updated_at"] = datetime.fromtimestamp(
+                seen_at, timezone.utc
+            ).strftime(TIMESTAMP_FORMAT)
+            user_sessions.append(UserSession._from_json(obj_json))
+        if user_sessions:
+            UserSession.save_many(user_sessions)
+            self.touch_writes += len(user_sessions)
+        return len(user_sessions)
+
+    def stats(self) -> dict:
+        """
+        Retrieves the counters of the authentication.
+
+        Returns:
+          dict: The counters of SessionExpAuth, and the number of last uses
+          saved.
+        """
+        stats = super().stats()
+        stats["touch_writes"] = self.touch_writes
+        return stats
+
+    def session_metrics(self) -> dict:
+        """
+        Retrieves the metrics of the sessions.
+
+        Returns:
+          dict: The metrics of SessionAuth, where the sessions are the
+          UserSession objects and their size the size of their storage.
+        """
+        storage_stats = UserSession.stats()
+        return self.metrics.snapshot(
+            storage_stats["objects"],
+            storage_stats["file_bytes"],
+            self.metrics.expired_lookups,
+        )
+
+    def purge_expired(self, now: float = None) -> int:
+        """
+        Removes the UserSession objects of the expired sessions, found with
+        the index on created_at (updated_at with sliding expiration), with
+        one write of the storage.
+
+        Args:
+          now (float): The current time, in seconds since the epoch.
+
+        Returns:
+          int: The number of sessions removed.
+        """
+        if self.session_duration <= 0:
+            return 0
+        self.save_touches()
+        now = time.time() if now is None else now
+        # Timestamps are naive UTC datetimes
+        cutoff = datetime.fromtimestamp(
+            now - self.session_duration, timezone.utc
+        ).replace(tzinfo=None)
+        field = "updated_at" if self.sliding else "created_at"
+        expired = UserSession.search({field: {"lte": cutoff}})
+        UserSession.remove_many(expired)
+        return len(expired)
+
+    def expire_sessions(self, now: float = None) -> int:
+        """
+        Removes the expired sessions from the cache, saves the queued last
+        uses, and purges the expired UserSession objects if
+        SESSION_PURGE_INTERVAL elapsed.
+
+        Args:
+          now (float): The current time, in seconds since the epoch.
+
+        Returns:
+          int: The number of sessions removed from the cache.
+        """
+        removed = super().expire_sessions(now)
+        self.save_touches()
+        if self.purge_interval <= 0:
+            return removed
+        if time.monotonic() - self._purged_at >= self.purge_interval:
+            self._purged_at = time.monotonic()
+            purged = self.purge_expired(now)
+            logger.info("Purged %d expired sessions", purged)
+        return removed
 
     def create_session(self, user_id: str = None) -> str:
         """
@@ -26,12 +207,87 @@ class SessionDBAuth(SessionExpAuth):
 
         session_id = super().create_session(user_id)
 
-        session_dictionary = {"user_id": user_id, "session_id": session_id}
-        user_session = UserSession(**session_dictionary)
-
+        user_session = UserSession(
+            id=session_id, user_id=user_id, session_id=session_id
+        )
         user_session.save()
+        self.evict_sessions(user_id, session_id)
         return session_id
 
+    def evict_sessions(self, user_id: str, session_id: str) -> int:
+        """
+        Removes, with one write of the storage, the UserSession objects
+        beyond the session limits once a session of a user was created:
+        the oldest sessions of the user beyond SESSION_MAX_PER_USER, found
+        with the index on user_id, then the least recently used sessions
+        beyond SESSION_MAX, found with the index on updated_at.
+
+        Args:
+          user_id (str): The ID of the user.
+          session_id (str): The ID of the session created, which is kept.
+
+        Returns:
+          int: The number of UserSession objects removed.
+        """
+        evicted = []
+        if self.max_per_user > 0:
+            others = [
+                user_session
+                for user_session in UserSession.search({"user_id": user_id})
+                if user_session.id != session_id
+            ]
+            others.sort(key=lambda user_session: user_session.created_at)
+            evicted = others[: max(0, len(others) + 1 - self.max_per_user)]
+        excess = UserSession.count() - len(evicted) - self.max_sessions
+        if self.max_sessions > 0 and excess > 0:
+            skipped = {user_session.id for user_session in evicted}
+            skipped.add(session_id)
+            # updated_at is the last use with sliding expiration, else the
+            # creation
+            for user_session in UserSession.iter_search(order_by="updated_at"):
+                if excess <= 0:
+                    break
+                if user_session.id not in skipped:
+                    evicted.append(user_session)
+                    excess -= 1
+        if not evicted:
+            return 0
+
+        with self._touch_lock:
+            for user_session in evicted:
+                self._touched.pop(user_session.session_id, None)
+        UserSession.remove_many(evicted)
+        for user_session in evicted:
+            self.store.delete(user_session.session_id)
+        return len(evicted)
+
+    @classmethod
+    def _user_session(cls, session_id: str) -> UserSession:
+        """
+        Retrieves the UserSession of a session ID.
+
+        Args:
+          session_id (str): The session ID.
+
+        Returns:
+          UserSession: The session, or None.
+        """
+        user_session = UserSession.get(session_id)
+        if user_session is not None and user_session.session_id == session_id:
+            return user_session
+        if not cls._legacy_sessions:
+            return None
+
+        legacy = False
+        for user_session in UserSession.iter_search():
+            if user_session.id != user_session.session_id:
+                if user_session.session_id == session_id:
+                    return user_session
+                legacy = True
+        # New sessions are all saved under their ID: none will come back
+        cls._legacy_sessions = legacy
+        return None
+
     def user_id_for_session_id(self, session_id: str = None) -> str:
         """
         Retrieves the user ID associated with a given session ID.
@@ -40,23 +296,104 @@ class SessionDBAuth(SessionExpAuth):
           session_id (str): The session ID to retrieve the user ID for.
 
         Returns:
-          str: The user ID associated with the session ID.
+          str: The user ID associated with the session ID, or None if the
+          session does not exist or expired.
         """
-        try:
-            sessions_list = UserSession.search({"session_id": session_id})
-        except Exception:
+        if not session_id or not isinstance(session_id, str):
+            return None
+
+        # The store evicts expired sessions instead of returning them
+        session = self.store.get(session_id)
+        if session is not None:
+            if UserSession.get(session_id) is not None:
+                self.seen(session_id, session)
+                return session.user_id
+            self.store.delete(session_id)
             return None
 
-        if not sessions_list or not len(sessions_list):
+        user_session = self._user_session(session_id)
+        if user_session is None:
             return None
 
-        curr_time = datetime.now()
-        session_dur = timedelta(seconds=self.session_duration)
-        session_exp = sessions_list[0].created_at + session_dur
-        if session_exp < curr_time:
+        # Timestamps are naive UTC datetimes
+        created_at = user_session.created_at.replace(
+            tzinfo=timezone.utc
+        ).timestamp()
+        created_at = epoch_second(created_at)
+        if self.sliding:
+            expires_at = self.expires_at(
+                user_session.updated_at.replace(
+                    tzinfo=timezone.utc
+                ).timestamp()
+            )
+        else:
+            expires_at = self.expires_at(created_at)
+        if expires_at is not None and expires_at <= int(time.time()):
+            self.metrics.expired_lookups += 1
             return None
 
-        return sessions_list[0].user_id
+        # Only sessions stored under their ID can be checked on a hit
+        if user_session.id == session_id:
+            session = Session(user_session.user_id, created_at, expires_at)
+            self.store.set(session_id, session)
+            self.seen(session_id, session)
+        return user_session.user_id
+
+    def user_sessions(self, user_id: str) -> List[Tuple[str, Session]]:
+        """
+        Lists the live sessions of a user, found with the index on user_id
+        of the storage, which all workers share, instead of the cache.
+
+        Args:
+          user_id (str): The ID of the user.
+
+        Returns:
+          List[Tuple[str, Session]]: The (session ID, session) pairs.
+        """
+        now = int(time.time())
+        sessions = []
+        for user_session in UserSession.search({"user_id": user_id}):
+            # Timestamps are naive UTC datetimes
+            created_at = user_session.created_at.replace(
+                tzinfo=timezone.utc
+            ).timestamp()
+            created_at = epoch_second(created_at)
+            last_use = created_at
+            if self.sliding:
+                last_use = user_session.updated_at.replace(
+                    tzinfo=timezone.utc
+                ).timestamp()
+            expires_at = self.expires_at(last_use)
+            if expires_at is not None and expires_at <= now:
+                continue
+            sessions.append(
+                (
+                    user_session.session_id,
+                    Session(user_id, created_at, expires_at),
+                )
+            )
+        sessions.sort(key=lambda item: item[1].created_at)
+        return sessions
+
+    def destroy_user_sessions(self, user_id: str) -> int:
+        """
+        Destroys every session of a user with one write of the storage.
+
+        Args:
+          user_id (str): The ID of the user.
+
+        Returns:
+          int: The number of UserSession objects removed.
+        """
+        user_sessions = UserSession.search({"user_id": user_id})
+        with self._touch_lock:
+            for user_session in user_sessions:
+                self._touched.pop(user_session.session_id, None)
+        UserSession.remove_many(user_sessions)
+        # Other workers drop their cached sessions on the next lookup
+        self.store.delete_user(user_id)
+        self.metrics.destroyed.add(len(user_sessions))
+        return len(user_sessions)
 
     def destroy_session(self, request=None):
         """
@@ -66,7 +403,8 @@ class SessionDBAuth(SessionExpAuth):
           request (Request): The request object. Defaults to None.
 
         Returns:
-          None
+          bool: True if the session is successfully destroyed, False
+          otherwise.
         """
         if not request:
             return False
@@ -76,10 +414,14 @@ class SessionDBAuth(SessionExpAuth):
         if not session_id:
             return False
 
-        sessions_list = UserSession.search({"session_id": session_id})
+        self.store.delete(session_id)
+        with self._touch_lock:
+            self._touched.pop(session_id, None)
+        user_session = self._user_session(session_id)
 
-        if not sessions_list or not len(sessions_list):
+        if user_session is None:
             return False
 
-        sessions_list[0].remove()
+        user_session.remove()
+        self.metrics.destroyed.add()
         return True
@@ -3,14 +3,21 @@
 """Session auth with expiration date for the sessionId"""
 
 
-from datetime import datetime, timedelta
+import time
 from os import getenv
 
 from api.v1.auth.session_auth import SessionAuth
+from api.v1.auth.session_store import Session, epoch_second
 
 
 class SessionExpAuth(SessionAuth):
-    """Session auth with expiration date for the sessionId"""
+    """Session auth with expiration date for the sessionId
+
+    Sessions expire SESSION_DURATION seconds after their creation or, with
+    SESSION_SLIDING=1, after their last use. A use only moves the
+    expiration once it lags by SESSION_TOUCH_INTERVAL seconds (default
+    60), so a session is written to the store at most once per interval.
+    """
 
     def __init__(self) -> None:
         """
@@ -21,55 +28,62 @@ class SessionExpAuth(SessionAuth):
             self.session_duration = int(getenv("SESSION_DURATION"))
         except Exception:
             self.session_duration = 0
-
-    def create_session(self, user_id: str = None) -> str:
+        self.sliding = getenv("SESSION_SLIDING", "0").lower() in (
+            "1",
+            "true",
+            "yes",
+        )
+        self.touch_interval = float(getenv("SESSION_TOUCH_INTERVAL", "60"))
+        self.touches = 0
+
+    def expires_at(self, created_at: float) -> int:
         """
-        Creates a session for the given user ID.
+        Computes the expiration time of a new session, or with sliding
+        expiration of a session last used at `created_at`.
 
         Args:
-          user_id (str, optional): The ID of the user. Defaults to None.
+          created_at (float): The creation time, in seconds since the epoch.
 
         Returns:
-          str: The session ID.
-
+          int: The expiration time, the second SESSION_DURATION seconds
+          after the creation, or None if SESSION_DURATION is not positive.
         """
-        session_id = super().create_session(user_id)
-
-        if not session_id:
+        if self.session_duration <= 0:
             return None
+        return epoch_second(created_at + self.session_duration, ceil=True)
 
-        self.user_id_by_session_id[session_id] = {
-            "user_id": user_id,
-            "created_at": datetime.now(),
-        }
-
-        return session_id
-
-    def user_id_for_session_id(self, session_id: str = None) -> str:
+    def seen(self, session_id: str, session: Session) -> bool:
         """
-        Retrieve the user ID associated with the given session ID.
+        Records a use of a session, moving its expiration if it is sliding
+        and lags by SESSION_TOUCH_INTERVAL seconds.
 
         Args:
-          session_id (str): The session ID to retrieve the user ID for.
+          session_id (str): The session ID.
+          session (Session): The session.
 
         Returns:
-          str: The user ID associated with the session ID,
-          or None if the session ID is invalid or expired.
+          bool: True if the expiration of the session moved.
         """
-        if session_id in self.user_id_by_session_id:
-            session_dict = self.user_id_by_session_id[session_id]
-
-            if self.session_duration <= 0:
-                return session_dict["user_id"]
-
-            if "created_at" not in session_dict:
-                return None
-
-            curr_time = datetime.now()
-            time_range = timedelta(seconds=self.session_duration)
-            session_exp = session_dict["created_at"] + time_range
-
-            if session_exp < curr_time:
-                return None
+        if not self.sliding or session.expires_at is None:
+            return False
+        now = time.time()
+        last_touch = session.expires_at - self.session_duration
+        if now - last_touch < self.touch_interval:
+            return False
+        # A session destroyed meanwhile is not added back
+        if not self.store.touch(session_id, self.expires_at(now)):
+            return False
+        self.touches += 1
+        return True
+
+    def stats(self) -> dict:
+        """
+        Retrieves the counters of the authentication.
 
-            return session_dict["user_id"]
+        Returns:
+          dict: The counters of the session store, and the number of
+          sessions whose sliding expiration moved.
+        """
+        stats = super().stats()
+        stats["touches"] = self.touches
+        return stats
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+"""Counters and gauges of the session layer"""
+
+import threading
+import time
+
+
+class RateCounter:
+    """
+    Counts events, in total and per second over the last WINDOW seconds.
+
+    Events are added to one bucket per second, reused once WINDOW seconds
+    old, so adding and reading the rate cost O(1) and O(WINDOW).
+    """
+
+    WINDOW = 60
+
+    def __init__(self):
+        """
+        Initializes a counter without events.
+        """
+        self.total = 0
+        self._seconds = [0] * self.WINDOW
+        self._counts = [0] * self.WINDOW
+        self._lock = threading.Lock()
+
+    def add(self, count: int = 1, now: float = None):
+        """
+        Adds events.
+
+        Args:
+          count (int): The number of events.
+          now (float): The current time, in seconds since the epoch.
+        """
+        second = int(time.time() if now is None else now)
+        i = second % self.WINDOW
+        with self._lock:
+            if self._seconds[i] != second:
+                self._seconds[i] = second
+                self._counts[i] = 0
+            self._counts[i] += count
+            self.total += count
+
+    def rate(self, now: float = None) -> float:
+        """
+        Events per second over the last WINDOW seconds.
+
+        Args:
+          now (float): The current time, in seconds since the epoch.
+
+        Returns:
+          float: The average rate.
+        """
+        second = int(time.time() if now is None else now)
+        with self._lock:
+            count = sum(
+                n
+                for s, n in zip(self._seconds, self._counts)
+                if second - self.WINDOW < s <= second
+            )
+        return count / self.WINDOW
+
+
+class LatencyHistogram:
+    """
+    Histogram of durations in power of two buckets of microseconds.
+
+    A duration of d microseconds falls in the bucket whose upper bound is
+    the smallest power of two above d, found with `int.bit_length`, up to
+    2 ** (BUCKETS - 2) microseconds; longer ones fall in the last bucket.
+    """
+
+    BUCKETS = 20
+
+    def __init__(self):
+        """
+        Initializes an empty histogram.
+        """
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        """
+        Adds a duration.
+
+        Args:
+          seconds (float): The duration, in seconds.
+        """
+        i = min(int(seconds * 1e6).bit_length(), self.BUCKETS - 1)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.total += seconds
+
+    @classmethod
+    def _bound(cls, i: int) -> str:
+        """Upper bound of bucket i, in microseconds"""
+        return "+Inf" if i == cls.BUCKETS - 1 else str(2**i)
+
+    def _quantile(self, counts: list, count: int, q: float) -> str:
+        """Upper bound of the bucket of the q quantile"""
+        rank = q * count
+        seen = 0
+        for i, n in enumerate(counts):
+            seen += n
+            if seen >= rank:
+                return self._bound(i)
+        return None
+
+    def snapshot(self) -> dict:
+        """
+        Retrieves the histogram.
+
+        Returns:
+          dict: The number of durations, their mean, the upper bounds of
+          the buckets of the median and the 99th percentile, and the
+          count of each non-empty bucket by upper bound, in microseconds.
+        """
+        with self._lock:
+            counts = list(self.counts)
+            count, total = self.count, self.total
+        if not count:
+            return {"count": 0}
+        return {
+            "count": count,
+            "mean_us": round(total / count * 1e6, 1),
+            "p50_le_us": self._quantile(counts, count, 0.5),
+            "p99_le_us": self._quantile(counts, count, 0.99),
+            "buckets_le_us": {
+                self._bound(i): n for i, n in enumerate(counts) if n
+            },
+        }
+
+
+class SessionMetrics:
+    """
+    Metrics of a session authentication: sessions created and destroyed,
+    lookups of expired sessions and the latency of session lookups.
+    """
+
+    def __init__(self):
+        """
+        Initializes the metrics.
+        """
+        self.created = RateCounter()
+        self.destroyed = RateCounter()
+        self.expired_lookups = 0
+        self.lookups = LatencyHistogram()
+
+    def snapshot(
+        self, active: int, store_bytes: int, expired_lookups: int
+    ) -> dict:
+        """
+        Retrieves the metrics with the gauges of the authentication.
+
+        Args:
+          active (int): The number of sessions, or None if unknown.
+          store_bytes (int): The size of the sessions, or None if unknown.
+          expired_lookups (int): The number of lookups of expired sessions.
+
+        Returns:
+          dict: The metrics.
+        """
+        now = time.time()
+        return {
+            "active_sessions": active,
+            "created": self.created.total,
+            "created_per_second": round(self.created.rate(now), 3),
+            "destroyed": self.destroyed.total,
+            "destroyed_per_second": round(self.destroyed.rate(now), 3),
+            "expired_lookups": expired_lookups,
+            "lookup_latency": self.lookups.snapshot(),
+            "store_bytes": store_bytes,
+        }
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+"""
+Stores of the sessions of SessionAuth and its subclasses.
+
+Every store maps session IDs to Session records and provides:
+- `set(session_id, session)`: adds or replaces a session
+- `get(session_id)`: returns a session, or None; an expired session is
+  evicted instead
+- `delete(session_id)`: removes a session, returns True if it existed
+- `touch(session_id, expires_at)`: moves the expiration of a session,
+  returns False if it does not exist (it is not added back)
+- `expire(now)`: removes every session expired at `now` (seconds since
+  the epoch) in batches, returns the number removed
+- `user_sessions(user_id)`: lists the (session ID, session) pairs of a
+  user, in O(number of sessions of the user)
+- `delete_user(user_id)`: removes every session of a user, returns the
+  number removed
+- `items()`: lists the (session ID, session) pairs
+- `stats()`: counters, at least `sessions` and `evicted` (expired
+  sessions removed)
+- `len(store)`: the number of sessions
+"""
+
+import math
+from collections import namedtuple
+from os import getenv
+
+# expires_at is None for sessions that never expire; times are whole
+# seconds since the epoch (see `epoch_second`), comparable between
+# processes
+Session = namedtuple("Session", ("user_id", "created_at", "expires_at"))
+
+# Distinct seconds shared by `epoch_second` before starting over
+SHARED_SECONDS = 4096
+_seconds = {}
+
+
+def epoch_second(t: float, ceil: bool = False) -> int:
+    """
+    Whole second of a time, as an int shared by every session of that
+    second: the sessions created or expiring in the same second hold one
+    int instead of a float each.
+
+    Args:
+      t (float): The time, in seconds since the epoch.
+      ceil (bool): Round up (for expiration times) instead of down.
+
+    Returns:
+      int: The second.
+    """
+    second = math.ceil(t) if ceil else int(t)
+    shared = _seconds.get(second)
+    if shared is None:
+        if len(_seconds) >= SHARED_SECONDS:
+            _seconds.clear()
+        shared = _seconds[second] = second
+    return shared
+
+
+def new_session_store(limits: bool = True):
+    """
+    Creates the session store selected by SESSION_STORE.
+
+    - `memory` (default): a dict of the process
+    - `sqlite`: a table of the SESSION_STORE_PATH SQLite database (default
+      `.db_sessions.sqlite3`), shared by the processes of the host
+    - `server`: the store served at SESSION_STORE_ADDRESS (default
+      `127.0.0.1:5001`) by `python3 -m api.v1.auth.session_store.server`,
+      shared by every process that can reach it
+
+    A user has at most SESSION_MAX_PER_USER sessions (default 20, 0 for no
+    limit), the oldest being evicted. The memory store (served or not)
+    keeps at most SESSION_MAX sessions (default 100000, 0 for no limit),
+    the least recently used being evicted.
+
+    Args:
+      limits (bool): False to ignore both limits, e.g. for records that
+      must be kept until they expire. A served store uses the limits of
+      the server, or its store without limits.
+
+    Returns:
+      The session store.
+    """
+    store_type = getenv("SESSION_STORE", "memory")
+    max_per_user = int(getenv("SESSION_MAX_PER_USER", "20")) if limits else 0
+    if store_type == "sqlite":
+        from api.v1.auth.session_store.sqlite import SQLiteSessionStore
+
+        return SQLiteSessionStore(
+            getenv("SESSION_STORE_PATH", ".db_sessions.sqlite3"),
+            max_per_user=max_per_user,
+        )
+    if store_type == "server":
+        from api.v1.auth.session_store.server import RemoteSessionStore
+
+        return RemoteSessionStore(limits=limits)
+
+    from api.v1.auth.session_store.memory import MemorySessionStore
+
+    if not limits:
+        return MemorySessionStore()
+    return MemorySessionStore.from_env()
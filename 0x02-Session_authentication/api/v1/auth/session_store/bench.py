@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+"""
+Latency benchmark of the session stores.
+
+    $ python3 -m api.v1.auth.session_store.bench [sessions]
+
+Every store is filled with `sessions` sessions (default 10000), half of
+them already expired, then expired in batch, read and emptied. The
+server store is served by a child process on a free local port.
+"""
+
+import os
+import socket
+import sys
+import tempfile
+import time
+import uuid
+from multiprocessing import Process
+from typing import Callable, List
+
+from api.v1.auth.session_store import Session
+from api.v1.auth.session_store.memory import MemorySessionStore
+from api.v1.auth.session_store.server import RemoteSessionStore, serve
+from api.v1.auth.session_store.sqlite import SQLiteSessionStore
+
+
+def _percentiles(latencies: List[float]) -> str:
+    """
+    p50, p99 and max of latencies in seconds, in microseconds.
+    """
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)]
+    return "p50 {:8.1f} us  p99 {:8.1f} us  max {:8.1f} us".format(
+        p50 * 1e6, p99 * 1e6, latencies[-1] * 1e6
+    )
+
+
+def _timed(calls: List[Callable[[], object]]) -> List[float]:
+    """
+    Latency of each call.
+    """
+    latencies = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench(name: str, store, sessions: int, out=sys.stdout):
+    """
+    Measures the operations of a store.
+
+    Args:
+      name (str): The name of the store in the report.
+      store: The session store.
+      sessions (int): The number of sessions.
+      out: The stream of the report.
+    """
+    now = int(time.time())
+    ids = [str(uuid.uuid4()) for _ in range(sessions)]
+    records = [
+        Session("user-{}".format(i % 1000), now, now + (-1 if i % 2 else 60))
+        for i in range(sessions)
+    ]
+
+    sets = _timed(
+        [lambda i=i: store.set(ids[i], records[i]) for i in range(sessions)]
+    )
+    start = time.perf_counter()
+    expired = store.expire(now)
+    expire_time = time.perf_counter() - start
+    gets = _timed([lambda i=i: store.get(ids[i]) for i in range(sessions)])
+    deletes = _timed([lambda sid=sid: store.delete(sid) for sid in ids[::2]])
+
+    out.write("{} ({} sessions)\n".format(name, sessions))
+    out.write("  set     {}\n".format(_percentiles(sets)))
+    out.write("  get     {}\n".format(_percentiles(gets)))
+    out.write("  delete  {}\n".format(_percentiles(deletes)))
+    out.write(
+        "  expire  {} sessions in {:.1f} ms ({:.2f} us/session)\n".format(
+            expired, expire_time * 1e3, expire_time * 1e6 / max(1, expired)
+        )
+    )
+    out.flush()
+
+
+def _free_port() -> int:
+    """
+    A free TCP port of the loopback interface.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main(sessions: int = 10000):
+    """
+    Benchmarks every store.
+
+    Args:
+      sessions (int): The number of sessions.
+    """
+    bench("memory", MemorySessionStore(), sessions)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "sessions.sqlite3")
+        bench("sqlite", SQLiteSessionStore(db_path), sessions)
+
+    address = ("127.0.0.1", _free_port())
+    authkey = os.urandom(16)
+    server = Process(target=serve, args=(address, authkey), daemon=True)
+    server.start()
+    try:
+        store = RemoteSessionStore(address, authkey)
+        for _ in range(100):
+            try:
+                len(store)
+                break
+            except (ConnectionError, EOFError):
+                time.sleep(0.05)
+                store = RemoteSessionStore(address, authkey)
+        bench("server", store, sessions)
+    finally:
+        server.terminate()
+        server.join()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
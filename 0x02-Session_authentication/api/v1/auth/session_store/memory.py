@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+
+"""In-process session store"""
+
+import heapq
+import itertools
+import math
+import sys
+import threading
+import time
+from collections import OrderedDict
+from os import getenv
+from typing import List, Tuple
+
+from api.v1.auth.session_store import Session
+
+
+class MemorySessionStore:
+    """
+    Sessions kept in a dict of the process.
+
+    Sessions are lost on restart and not shared between processes.
+
+    Expiring sessions are also filed in a timing wheel: one bucket of
+    session IDs per second of expiration, and a heap of the seconds that
+    have a bucket. Expiring takes whole buckets from the top of the heap,
+    so each session costs O(1) to evict, whatever the number of sessions.
+    A session read after its expiration is evicted right away.
+
+    Sessions are kept in least recently used order, and the sessions of
+    each user in creation order, so both limits are enforced in O(1):
+    beyond `max_sessions`, the least recently used session is evicted,
+    and beyond `max_per_user` sessions of a user, their oldest one.
+    """
+
+    # Sessions removed per hold of the lock when expiring
+    EXPIRE_BATCH = 1000
+    # Records measured to estimate the size of the store
+    SIZE_SAMPLE = 64
+
+    def __init__(self, max_sessions: int = 0, max_per_user: int = 0):
+        """
+        Initializes an empty store.
+
+        Args:
+          max_sessions (int): The maximum number of sessions, 0 for none.
+          max_per_user (int): The maximum number of sessions of a user, 0
+          for none.
+        """
+        self.max_sessions = max_sessions
+        self.max_per_user = max_per_user
+        self._sessions = OrderedDict()
+        self._by_user = {}
+        self._buckets = {}
+        self._seconds = []
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self.expired_gets = 0
+        self.lru_evicted = 0
+        self.user_cap_evicted = 0
+
+    @classmethod
+    def from_env(cls) -> "MemorySessionStore":
+        """
+        Creates a store limited by SESSION_MAX (default 100000) and
+        SESSION_MAX_PER_USER (default 20).
+
+        Returns:
+          MemorySessionStore: The store.
+        """
+        return cls(
+            max_sessions=int(getenv("SESSION_MAX", "100000")),
+            max_per_user=int(getenv("SESSION_MAX_PER_USER", "20")),
+        )
+
+    def __len__(self) -> int:
+        """
+        Number of sessions.
+        """
+        return len(self._sessions)
+
+    def _schedule(self, session_id: str, session: Session):
+        """
+        Files a session in the bucket of its expiration; the caller holds
+        the lock.
+        """
+        if session.expires_at is None:
+            return
+        # Everything in the bucket of second k expires at k at the latest
+        second = math.ceil(session.expires_at)
+        bucket = self._buckets.get(second)
+        if bucket is None:
+            bucket = self._buckets[second] = set()
+            heapq.heappush(self._seconds, second)
+        bucket.add(session_id)
+
+    def _unschedule(self, session_id: str, session: Session):
+        """
+        Takes a session out of its bucket; the caller holds the lock.
+        """
+        if session.expires_at is None:
+            return
+        bucket = self._buckets.get(math.ceil(session.expires_at))
+        if bucket is not None:
+            bucket.discard(session_id)
+
+    def _add(self, session_id: str, session: Session):
+        """
+        Adds a session to the indexes; the caller holds the lock.
+        """
+        self._sessions[session_id] = session
+        self._by_user.setdefault(session.user_id, {})[session_id] = None
+        self._schedule(session_id, session)
+
+    def _remove(self, session_id: str) -> Session:
+        """
+        Removes a session from the indexes; the caller holds the lock.
+
+        Returns:
+          Session: The session removed, or None.
+        """
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return None
+        user_sessions = self._by_user.get(session.user_id)
+        if user_sessions is not None:
+            user_sessions.pop(session_id, None)
+            if not user_sessions:
+                del self._by_user[session.user_id]
+        self._unschedule(session_id, session)
+        return session
+
+    def set(self, session_id: str, session: Session):
+        """
+        Adds or replaces a session, evicting sessions beyond the limits.
+
+        Args:
+          session_id (str): The session ID.
+          session (Session): The session.
+        """
+        with self._lock:
+            self._remove(session_id)
+            self._add(session_id, session)
+
+            user_sessions = self._by_user[session.user_id]
+            if 0 < self.max_per_user < len(user_sessions):
+                self._remove(next(iter(user_sessions)))
+                self.user_cap_evicted += 1
+            while 0 < self.max_sessions < len(self._sessions):
+                self._remove(next(iter(self._sessions)))
+                self.lru_evicted += 1
+
+    def get(self, session_id: str) -> Session:
+        """
+        Retrieves a session, now the most recently used.
+
+        Args:
+          session_id (str): The session ID.
+
+        Returns:
+          Session: The session, or None if it does not exist or expired.
+        """
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+
+        expires_at = session.expires_at
+        expired = expires_at is not None and expires_at <= int(time.time())
+        with self._lock:
+            if self._sessions.get(session_id) is not session:
+                return None
+            if not expired:
+                self._sessions.move_to_end(session_id)
+                return session
+            self._remove(session_id)
+            self.evicted += 1
+            self.expired_gets += 1
+        return None
+
+    def delete(self, session_id: str) -> bool:
+        """
+        Removes a session.
+
+        Args:
+          session_id (str): The session ID.
+
+        Returns:
+          bool: True if the session existed.
+        """
+        with self._lock:
+            return self._remove(session_id) is not None
+
+    def touch(self, session_id: str, expires_at: int) -> bool:
+        """
+        Moves the expiration of a session.
+
+        Args:
+          session_id (str): The session ID.
+          expires_at (int): The new expiration time.
+
+        Returns:
+          bool: True if the session exists.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return False
+            self._unschedule(session_id, session)
+            session = session._replace(expires_at=expires_at)
+            self._sessions[session_id] = session
+            self._schedule(session_id, session)
+            return True
+
+    def expire(self, now: float) -> int:
+        """
+        Removes the sessions expired at a given time.
+
+        Buckets are emptied EXPIRE_BATCH sessions per hold of the lock, so
+        other threads are not blocked for long.
+
+        Args:
+          now (float): The time, in seconds since the epoch.
+
+        Returns:
+          int: The number of sessions removed.
+        """
+        removed = 0
+        while True:
+            with self._lock:
+                batch = 0
+                while self._seconds and self._seconds[0] <= now:
+                    second = self._seconds[0]
+                    bucket = self._buckets[second]
+                    while bucket and batch < self.EXPIRE_BATCH:
+                        # pop resumes where it stopped, unlike next(iter())
+                        # which rescans the slots emptied before
+                        self._remove(bucket.pop())
+                        batch += 1
+                    if bucket:
+                        break
+                    heapq.heappop(self._seconds)
+                    del self._buckets[second]
+                removed += batch
+                self.evicted += batch
+                if batch < self.EXPIRE_BATCH:
+                    return removed
+
+    def user_sessions(self, user_id: str) -> List[Tuple[str, Session]]:
+        """
+        Lists the sessions of a user.
+
+        Args:
+          user_id (str): The user ID.
+
+        Returns:
+          List[Tuple[str, Session]]: The (session ID, session) pairs, the
+          oldest first.
+        """
+        with self._lock:
+            return [
+                (session_id, self._sessions[session_id])
+                for session_id in self._by_user.get(user_id, ())
+            ]
+
+    def delete_user(self, user_id: str) -> int:
+        """
+        Removes every session of a user.
+
+        Args:
+          user_id (str): The user ID.
+
+        Returns:
+          int: The number of sessions removed.
+        """
+        with self._lock:
+            session_ids = list(self._by_user.get(user_id, ()))
+            for session_id in session_ids:
+                self._remove(session_id)
+            return len(session_ids)
+
+    def items(self) -> List[Tuple[str, Session]]:
+        """
+        Lists the sessions.
+
+        Returns:
+          List[Tuple[str, Session]]: The (session ID, session) pairs.
+        """
+        with self._lock:
+            return list(self._sessions.items())
+
+    def nbytes(self) -> int:
+        """
+        Estimates the memory used by the sessions: the size of the
+        indexes, plus the size of the first SIZE_SAMPLE records of each,
+        averaged, times their number.
+
+        Returns:
+          int: The estimated size in bytes.
+        """
+
+        def estimate(mapping: dict, record_size) -> int:
+            sample = list(itertools.islice(mapping.items(), self.SIZE_SAMPLE))
+            size = sys.getsizeof(mapping)
+            if sample:
+                total = sum(record_size(k, v) for k, v in sample)
+                size += total * len(mapping) // len(sample)
+            return size
+
+        def session_size(session_id: str, session: Session) -> int:
+            return (
+                sys.getsizeof(session_id)
+                + sys.getsizeof(session)
+                + sum(sys.getsizeof(field) for field in session)
+            )
+
+        def container_size(key, container) -> int:
+            return sys.getsizeof(key) + sys.getsizeof(container)
+
+        with self._lock:
+            return (
+                estimate(self._sessions, session_size)
+                + estimate(self._by_user, container_size)
+                + estimate(self._buckets, container_size)
+                + sys.getsizeof(self._seconds)
+            )
+
+    def stats(self) -> dict:
+        """
+        Counters of the store.
+
+        Returns:
+          dict: The number of sessions, their estimated size in bytes, the
+          number of expired sessions evicted (and of those evicted when
+          read), and of sessions evicted by the global and per-user limits.
+        """
+        return {
+            "sessions": len(self._sessions),
+            "bytes": self.nbytes(),
+            "evicted": self.evicted,
+            "expired_gets": self.expired_gets,
+            "lru_evicted": self.lru_evicted,
+            "user_cap_evicted": self.user_cap_evicted,
+        }
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+
+"""
+Session store served over the network.
+
+Stand-in for a key-value server such as Redis: one process keeps the
+sessions in memory and every worker, on any host that can reach it, uses
+them through a socket. It serves two stores: `store`, limited by
+SESSION_MAX and SESSION_MAX_PER_USER, and `unlimited_store`, for records
+that must be kept until they expire.
+
+    $ SESSION_STORE_AUTHKEY=secret python3 -m api.v1.auth.session_store.server
+
+Clients exchange pickles with the server: anyone who knows the secret can
+run code in the other processes, so there is no default secret.
+"""
+
+import os
+from multiprocessing.managers import BaseManager
+from os import getenv
+from typing import List, Tuple
+
+from api.v1.auth.session_store import Session
+from api.v1.auth.session_store.memory import MemorySessionStore
+
+EXPOSED = (
+    "set",
+    "get",
+    "delete",
+    "touch",
+    "user_sessions",
+    "delete_user",
+    "expire",
+    "items",
+    "stats",
+    "__len__",
+)
+
+
+def _address() -> Tuple[str, int]:
+    """
+    Address of the server, from SESSION_STORE_ADDRESS (`host:port`).
+    """
+    address = getenv("SESSION_STORE_ADDRESS", "127.0.0.1:5001")
+    host, _, port = address.rpartition(":")
+    return host, int(port)
+
+
+def _authkey() -> bytes:
+    """
+    Shared secret of the server and its clients, from
+    SESSION_STORE_AUTHKEY.
+
+    Raises:
+      ValueError: If SESSION_STORE_AUTHKEY is not set.
+    """
+    authkey = getenv("SESSION_STORE_AUTHKEY")
+    if not authkey:
+        raise ValueError("SESSION_STORE_AUTHKEY is not set")
+    return authkey.encode()
+
+
+class SessionServer(BaseManager):
+    """
+    Manager exposing a session store to other processes.
+    """
+
+
+class RemoteSessionStore:
+    """
+    Client of the session store of a SessionServer.
+
+    Each thread gets its own connection to the server, and a forked
+    process opens new ones instead of sharing its parent's sockets.
+    """
+
+    def __init__(
+        self,
+        address: Tuple[str, int] = None,
+        authkey: bytes = None,
+        limits: bool = True,
+    ):
+        """
+        Initializes the client; the server is connected on first use.
+
+        Args:
+          address (Tuple[str, int]): The host and port of the server.
+          authkey (bytes): The shared secret of the server, default
+          SESSION_STORE_AUTHKEY.
+          limits (bool): False to use the store of the server without
+          limits.
+
+        Raises:
+          ValueError: If no secret is given nor set.
+        """
+        self.address = address or _address()
+        self.authkey = authkey or _authkey()
+        self.limits = limits
+        self._pid = None
+        self._store = None
+
+    @property
+    def store(self):
+        """
+        Proxy of the store served, connected once per process.
+        """
+        if self._pid != os.getpid():
+            manager = SessionServer(address=self.address, authkey=self.authkey)
+            manager.connect()
+            if self.limits:
+                self._store = manager.store()
+            else:
+                self._store = manager.unlimited_store()
+            self._pid = os.getpid()
+        return self._store
+
+    def __len__(self) -> int:
+        """
+        Number of sessions.
+        """
+        return self.store.__len__()
+
+    def set(self, session_id: str, session: Session):
+        """
+        Adds or replaces a session.
+
+        Args:
+          session_id (str): The session ID.
+          session (Session): The session.
+        """
+        self.store.set(session_id, session)
+
+    def get(self, session_id: str) -> Session:
+        """
+        Retrieves a session.
+
+        Args:
+          session_id (str): The session ID.
+
+        Returns:
+          Session: The session, or None.
+        """
+        return self.store.get(session_id)
+
+    def delete(self, session_id: str) -> bool:
+        """
+        Removes a session.
+
+        Args:
+          session_id (str): The session ID.
+
+        Returns:
+          bool: True if the session existed.
+        """
+        return self.store.delete(session_id)
+
+    def touch(self, session_id: str, expires_at: int) -> bool:
+        """
+        Moves the expiration of a session.
+
+        Args:
+          session_id (str): The session ID.
+          expires_at (int): The new expiration time.
+
+        Returns:
+          bool: True if the session exists.
+        """
+        return self.store.touch(session_id, expires_at)
+
+    def expire(self, now: float) -> int:
+        """
+        Removes the sessions expired at a given time, in batches on the
+        server.
+
+        Args:
+          now (float): The time, in seconds since the epoch.
+
+        Returns:
+          int: The number of sessions removed.
+        """
+        return self.store.expire(now)
+
+    def user_sessions(self, user_id: str) -> List[Tuple[str, Session]]:
+        """
+        Lists the sessions of a user.
+
+        Args:
+          user_id (str): The user ID.
+
+        Returns:
+          List[Tuple[str, Session]]: The (session ID, session) pairs.
+        """
+        return self.store.user_sessions(user_id)
+
+    def delete_user(self, user_id: str) -> int:
+        """
+        Removes every session of a user.
+
+        Args:
+          user_id (str): The user ID.
+
+        Returns:
+          int: The number of sessions removed.
+        """
+        return self.store.delete_user(user_id)
+
+    def items(self) -> List[Tuple[str, Session]]:
+        """
+        Lists the sessions.
+
+        Returns:
+          List[Tuple[str, Session]]: The (session ID, session) pairs.
+        """
+        return self.store.items()
+
+    def stats(self) -> dict:
+        """
+        Counters of the store served.
+
+        Returns:
+          dict: The counters of the store served.
+        """
+        return self.store.stats()
+
+
+SessionServer.register("store", exposed=EXPOSED)
+SessionServer.register("unlimited_store", exposed=EXPOSED)
+
+
+def serve(address: Tuple[str, int] = None, authkey: bytes = None):
+    """
+    Serves the memory session stores until the process is stopped.
+
+    Args:
+      address (Tuple[str, int]): The host and port to listen on.
+      authkey (bytes): The shared secret of the clients, default
+      SESSION_STORE_AUTHKEY.
+
+    Raises:
+      ValueError: If no secret is given nor set.
+    """
+    authkey = authkey or _authkey()
+    store = MemorySessionStore.from_env()
+    unlimited_store = MemorySessionStore()
+    SessionServer.register("store", callable=lambda: store, exposed=EXPOSED)
+    SessionServer.register(
+        "unlimited_store", callable=lambda: unlimited_store, exposed=EXPOSED
+    )
+    manager = SessionServer(address=address or _address(), authkey=authkey)
+    manager.get_server().serve_forever()
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+
+"""SQLite session store"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Tuple
+
+from api.v1.auth.session_store import Session
+
+
+class SQLiteSessionStore:
+    """
+    Sessions kept in a table of an SQLite database in WAL mode.
+
+    Every process of the host opening the same file shares the sessions,
+    which also survive restarts. Readers never wait for writers in WAL
+    mode.
+
+    Beyond `max_per_user` sessions of a user, their oldest ones are
+    removed in the transaction adding the session, found with the index
+    on (user_id, created_at). There is no global limit: sessions are on
+    disk, not in the memory of the workers.
+    """
+
+    # Sessions removed per transaction when expiring
+    EXPIRE_BATCH = 1000
+
+    def __init__(self, db_path: str, max_per_user: int = 0):
+        """
+        Opens the database and creates the table if needed.
+
+        Args:
+          db_path (str): The path of the database file.
+          max_per_user (int): The maximum number of sessions of a user, 0
+          for none.
+        """
+        self.db_path = db_path
+        self.max_per_user = max_per_user
+        self._local = threading.local()
+        self.evicted = 0
+        self.expired_gets = 0
+        self.user_cap_evicted = 0
+        with self.connection as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, user_id TEXT, "
+                "created_at INTEGER, expires_at INTEGER)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS sessions_expires_at "
+                "ON sessions (expires_at)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS sessions_user_id "
+                "ON sessions (user_id, created_at)"
+            )
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        Connection of the current thread.
+        """
+        conn = getattr(self._local, "connection", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = conn
+        return conn
+
+    def __len__(self) -> int:
+        """
+        Number of sessions.
+        """
+        sql = "SELECT COUNT(*) FROM sessions"
+        return self.connection.execute(sql).fetchone()[0]
+
+    def set(self, session_id: str, session: Session):
+        """
+        Adds or replaces a session, removing the oldest sessions of the
+        user beyond the limit.
+
+        Args:
+          session_id (str): The session ID.
+          session (Session): The session.
+        """
+        with self.connection as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+                (session_id,) + tuple(session),
+            )
+            if not self.max_per_user:
+                return
+            cursor = conn.execute(
+                "DELETE FROM sessions WHERE rowid IN (SELECT rowid FROM "
+                "sessions WHERE user_id = ? ORDER BY created_at DESC, "
+                "rowid DESC LIMIT -1 OFFSET ?)",
+                (session.user_id, self.max_per_user),
+            )
+        self.user_cap_evicted += cursor.rowcount
+
+    def get(self, session_id: str) -> Session:
+        """
+        Retrieves a session.
+
+        Args:
+          session_id (str): The session ID.
+
+        Returns:
+          Session: The session, or None if it does not exist or expired.
+        """
+        row = self.connection.execute(
+            "SELECT user_id, created_at, expires_at FROM sessions "
+            "WHERE session_id = ?",
+            (session_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        session = Session(*row)
+        if session.expires_at is None or session.expires_at > int(time.time()):
+            return session
+
+        with self.connection as conn:
+            cursor = conn.execute(
+                "DELETE FROM sessions WHERE session_id = ? AND expires_at = ?",
+                (session_id, session.expires_at),
+            )
+        self.evicted += cursor.rowcount
+        self.expired_gets += 1
+        return None
+
+    def delete(self, session_id: str) -> bool:
+        """
+        Removes a session.
+
+        Args:
+          session_id (str): The session ID.
+
+        Returns:
+          bool: True if the session existed.
+        """
+        with self.connection as conn:
+            cursor = conn.execute(
+                "DELETE FROM sessions WHERE session_id = ?", (session_id,)
+            )
+        return cursor.rowcount > 0
+
+    def touch(self, session_id: str, expires_at: int) -> bool:
+        """
+        Moves the expiration of a session.
+
+        Args:
+          session_id (str): The session ID.
+          expires_at (int): The new expiration time.
+
+        Returns:
+          bool: True if the session exists.
+        """
+        with self.connection as conn:
+            cursor = conn.execute(
+                "UPDATE sessions SET expires_at = ? WHERE session_id = ?",
+                (expires_at, session_id),
+            )
+        return cursor.rowcount > 0
+
+    def expire(self, now: float) -> int:
+        """
+        Removes the sessions expired at a given time.
+
+        Sessions are found with the index on expires_at and removed
+        EXPIRE_BATCH per transaction, so writers of other processes are
+        not blocked for long.
+
+        Args:
+          now (float): The time, in seconds since the epoch.
+
+        Returns:
+          int: The number of sessions removed.
+        """
+        sql = (
+            "DELETE FROM sessions WHERE rowid IN (SELECT rowid FROM sessions"
+            " WHERE expires_at <= ? LIMIT ?)"
+        )
+        removed = 0
+        while True:
+            with self.connection as conn:
+                cursor = conn.execute(sql, (now, self.EXPIRE_BATCH))
+            removed += cursor.rowcount
+            if cursor.rowcount < self.EXPIRE_BATCH:
+                self.evicted += removed
+                return removed
+
+    def user_sessions(self, user_id: str) -> List[Tuple[str, Session]]:
+        """
+        Lists the sessions of a user, found with the index on
+        (user_id, created_at).
+
+        Args:
+          user_id (str): The user ID.
+
+        Returns:
+          List[Tuple[str, Session]]: The (session ID, session) pairs, the
+          oldest first.
+        """
+        rows = self.connection.execute(
+            "SELECT session_id, user_id, created_at, expires_at FROM sessions"
+            " WHERE user_id = ? ORDER BY created_at",
+            (user_id,),
+        )
+        return [(row[0], Session(*row[1:])) for row in rows]
+
+    def delete_user(self, user_id: str) -> int:
+        """
+        Removes every session of a user.
+
+        Args:
+          user_id (str): The user ID.
+
+        Returns:
+          int: The number of sessions removed.
+        """
+        with self.connection as conn:
+            cursor = conn.execute(
+                "DELETE FROM sessions WHERE user_id = ?", (user_id,)
+            )
+        return cursor.rowcount
+
+    def items(self) -> List[Tuple[str, Session]]:
+        """
+        Lists the sessions.
+
+        Returns:
+          List[Tuple[str, Session]]: The (session ID, session) pairs.
+        """
+        rows = self.connection.execute(
+            "SELECT session_id, user_id, created_at, expires_at FROM sessions"
+        )
+        return [(row[0], Session(*row[1:])) for row in rows]
+
+    def stats(self) -> dict:
+        """
+        Counters of the store.
+
+        Returns:
+          dict: The number of sessions, the size in bytes of the database
+          and its write-ahead log, and the number of expired sessions
+          evicted (expired sessions read) and of sessions beyond the
+          per-user limit evicted by this process.
+        """
+        size = 0
+        for path in (self.db_path, self.db_path + "-wal"):
+            try:
+                size += os.path.getsize(path)
+            except OSError:
+                pass
+        return {
+            "sessions": len(self),
+            "bytes": size,
+            "evicted": self.evicted,
+            "expired_gets": self.expired_gets,
+            "user_cap_evicted": self.user_cap_evicted,
+        }
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+
+"""Session auth with signed tokens instead of server-side sessions"""
+
+import hashlib
+import hmac
+import logging
+import os
+import time
+from base64 import urlsafe_b64encode
+from os import getenv
+from typing import List, Tuple
+from uuid import uuid4
+
+from api.v1.auth.session_exp_auth import SessionExpAuth
+from api.v1.auth.session_store import Session, epoch_second
+
+logger = logging.getLogger(__name__)
+
+USER_REVOCATION_PREFIX = "user:"
+
+
+class SessionTokenAuth(SessionExpAuth):
+    """
+    Session auth where the session cookie is a signed token.
+
+    A token carries the user ID, the issue time (in milliseconds), the
+    expiration time and a token ID, with an HMAC-SHA256 of them keyed by
+    SESSION_TOKEN_SECRET:
+
+        <user_id>.<issued_at>.<expires_at>.<token_id>.<signature>
+
+    Checking a token only takes the HMAC and a clock read, so no session
+    has to be stored or shared between workers. Tokens expire
+    SESSION_DURATION seconds after their creation or, if it is not
+    positive, SESSION_TOKEN_MAX_AGE seconds after (default 30 days): a
+    revocation is only kept until the token expires, so tokens always do.
+
+    A logout adds the token ID to a revocation list, kept in the session
+    store until the token expires. The list stays small, but is only
+    shared between workers by the `sqlite` and `server` stores; with
+    SESSION_TOKEN_REVOCATION=0 a logout only drops the cookie and the
+    token stays valid until it expires.
+
+    Tokens are not listed per user, but all the tokens of a user are
+    revoked at once by a single entry of the list, `user:<user_id>`,
+    rejecting the tokens issued before it.
+    """
+
+    # Revocations must not be evicted before the tokens expire
+    store_limits = False
+
+    def __init__(self):
+        """
+        Initializes the signing key and the revocation list.
+        """
+        super().__init__()
+        secret = getenv("SESSION_TOKEN_SECRET")
+        if secret:
+            key = secret.encode("utf-8")
+        else:
+            logger.warning(
+                "SESSION_TOKEN_SECRET is not set, tokens are only valid "
+                "in this process"
+            )
+            key = os.urandom(32)
+        # Copied for each signature instead of hashing the key every time
+        self._mac = hmac.new(key, digestmod=hashlib.sha256)
+        self.revocation = getenv("SESSION_TOKEN_REVOCATION", "1") != "0"
+        self.max_age = int(getenv("SESSION_TOKEN_MAX_AGE", "2592000"))
+        self.issued = 0
+        self.verified = 0
+        self.rejected = 0
+        self.expired = 0
+        self.revoked = 0
+
+    def _sign(self, payload: str) -> str:
+        """
+        Signature of a token payload.
+
+        Args:
+          payload (str): The user ID, issue time, expiration time and
+          token ID.
+
+        Returns:
+          str: The unpadded base64url HMAC-SHA256 of the payload.
+        """
+        mac = self._mac.copy()
+        mac.update(payload.encode("utf-8"))
+        return urlsafe_b64encode(mac.digest()).rstrip(b"=").decode("ascii")
+
+    def expires_at(self, created_at: float) -> int:
+        """
+        Computes the expiration time of a new token.
+
+        Args:
+          created_at (float): The issue time, in seconds since the epoch.
+
+        Returns:
+          int: The second SESSION_DURATION seconds after the issue time, or
+          SESSION_TOKEN_MAX_AGE seconds after if SESSION_DURATION is not
+          positive.
+        """
+        if self.session_duration > 0:
+            return super().expires_at(created_at)
+        return epoch_second(created_at + self.max_age, ceil=True)
+
+    def _verify(self, token: str) -> Tuple[str, int, float, str]:
+        """
+        Checks the signature and the expiration of a token.
+
+        Args:
+          token (str): The token.
+
+        Returns:
+          Tuple[str, int, int, str]: The user ID, the issue time in
+          milliseconds, the expiration time and the token ID, or None if
+          the token is invalid or expired.
+        """
+        if not token or not isinstance(token, str):
+            return None
+        payload, _, signature = token.rpartition(".")
+        expected = self._sign(payload).encode("ascii")
+        if not hmac.compare_digest(expected, signature.encode("utf-8")):
+            self.rejected += 1
+            return None
+        user_id, issued_at, expires_at, token_id = payload.rsplit(".", 3)
+        issued_at = int(issued_at)
+        # Tokens issued without expiration (0) expire after the maximum age
+        expires_at = int(expires_at) or self.expires_at(issued_at / 1000)
+        if expires_at <= int(time.time()):
+            self.expired += 1
+            return None
+        return user_id, issued_at, expires_at, token_id
+
+    def create_session(self, user_id: str = None) -> str:
+        """
+        Issues a token for the given user ID.
+
+        Args:
+          user_id (str): The ID of the user.
+
+        Returns:
+          str: The token.
+        """
+        if not user_id or not isinstance(user_id, str):
+            return None
+
+        now = time.time()
+        payload = "{}.{}.{}.{}".format(
+            user_id, int(now * 1000), self.expires_at(now), uuid4().hex
+        )
+        self.issued += 1
+        self.metrics.created.add(now=now)
+        return "{}.{}".format(payload, self._sign(payload))
+
+    def user_id_for_session_id(self, session_id: str = None) -> str:
+        """
+        Retrieves the user ID of a token.
+
+        Args:
+          session_id (str): The token.
+
+        Returns:
+          str: The user ID, or None if the token is invalid, expired or
+          revoked.
+        """
+        claims = self._verify(session_id)
+        if claims is None:
+            return None
+        user_id, issued_at, _, token_id = claims
+        if self.revocation and self._revoked(user_id, issued_at, token_id):
+            self.revoked += 1
+            return None
+        self.verified += 1
+        return user_id
+
+    def _revoked(self, user_id: str, issued_at: int, token_id: str) -> bool:
+        """
+        Checks the revocation list for a token.
+
+        Args:
+          user_id (str): The user ID of the token.
+          issued_at (int): The issue time of the token, in milliseconds.
+          token_id (str): The token ID.
+
+        Returns:
+          bool: True if the token, or every token of the user issued until
+          then, was revoked.
+        """
+        if self.store.get(token_id) is not None:
+            return True
+        revoked = self.store.get(USER_REVOCATION_PREFIX + user_id)
+        return revoked is not None and issued_at <= revoked.created_at * 1000
+
+    def user_sessions(self, user_id: str) -> List[Tuple[str, Session]]:
+        """
+        Tokens are not stored, so they cannot be listed.
+
+        Returns None.
+        """
+        return None
+
+    def destroy_user_sessions(self, user_id: str) -> int:
+        """
+        Revokes every token issued to a user until now.
+
+        Args:
+          user_id (str): The ID of the user.
+
+        Returns:
+          int: 0, as the revoked tokens are not counted, or None if there is
+          no revocation list.
+        """
+        if not self.revocation:
+            return None
+        # Kept until the last token issued before now expires; created_at
+        # keeps its fraction to compare with the issue times in milliseconds
+        now = time.time()
+        self.store.set(
+            USER_REVOCATION_PREFIX + user_id,
+            Session(user_id, now, self.expires_at(now)),
+        )
+        self._start_sweeper()
+        return 0
+
+    def destroy_session(self, request=None) -> bool:
+        """
+        Revokes the token of a request.
+
+        Args:
+          request (Request): The request object (default: None).
+
+        Returns:
+          bool: True if the token was valid, False otherwise.
+        """
+        if not request:
+            return False
+        claims = self._verify(self.session_cookie(request))
+        if claims is None:
+            return False
+        if not self.revocation:
+            return True
+
+        user_id, _, expires_at, token_id = claims
+        if self.store.get(token_id) is not None:
+            return False
+        self.store.set(
+            token_id, Session(user_id, epoch_second(time.time()), expires_at)
+        )
+        self._start_sweeper()
+        self.metrics.destroyed.add()
+        return True
+
+    def session_metrics(self) -> dict:
+        """
+        Retrieves the metrics of the tokens.
+
+        Returns:
+          dict: The metrics of SessionAuth, where the tokens destroyed are
+          those revoked by a logout, the expired lookups the expired tokens
+          presented, and the size that of the revocation list. The number
+          of valid tokens is unknown.
+        """
+        return self.metrics.snapshot(
+            None, self.store.stats()["bytes"], self.expired
+        )
+
+    def stats(self) -> dict:
+        """
+        Retrieves the counters of the authentication.
+
+        Returns:
+          dict: The counters of the tokens and of the store of the
+          revocation list.
+        """
+        stats = super().stats()
+        stats["session_tokens"] = {
+            "issued": self.issued,
+            "verified": self.verified,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "revoked": self.revoked,
+        }
+        return stats
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+"""Coalescing of concurrent identical calls"""
+
+import threading
+from typing import Callable, Hashable
+
+
+class _Call:
+    """
+    One call in flight and its outcome.
+    """
+
+    def __init__(self):
+        """
+        Initializes a call not done yet.
+        """
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs a function once for concurrent calls with the same key.
+
+    The first caller of a key runs the function; callers arriving while it
+    runs wait for it and get the same result (or exception). Nothing is
+    kept once the call is done, so later calls run the function again.
+    """
+
+    def __init__(self):
+        """
+        Initializes with no call in flight.
+        """
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], object]) -> object:
+        """
+        Runs `fn`, or waits for the call in flight with the same key.
+
+        Args:
+          key (Hashable): The key identifying identical calls.
+          fn (Callable): The function to run.
+
+        Returns:
+          object: The result of `fn`.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict:
+        """
+        Counters of the calls.
+
+        Returns:
+          dict: The calls run, the calls that waited for another one and
+          the calls in flight.
+        """
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls),
+            }
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+"""Throttling of failed credential checks"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, List
+
+
+class _Shard:
+    """
+    Buckets of the keys hashed to one shard, in LRU order.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty shard.
+        """
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()
+        self.rejected = 0
+        self.failures = 0
+        self.evictions = 0
+
+
+class FailureThrottle:
+    """
+    Token buckets limiting failed credential checks per key.
+
+    Every key starts with `burst` tokens, refilled at `rate` tokens per
+    second. A failed check takes a token and a key without a whole token
+    left is rejected, so at most `burst` failures go through at once, then
+    one every 1 / `rate` seconds. A successful check forgets the key.
+
+    Keys are spread over shards, each with its own lock and at most
+    `max_keys / shards` buckets, the least recently used being evicted.
+    """
+
+    def __init__(
+        self,
+        burst: float = 5,
+        rate: float = 0.2,
+        max_keys: int = 10000,
+        shards: int = 16,
+    ):
+        """
+        Initializes the throttle.
+
+        Args:
+          burst (float): The failures allowed at once, 0 to disable.
+          rate (float): The failures allowed per second after a burst.
+          max_keys (int): The maximum number of keys remembered.
+          shards (int): The number of independently locked shards.
+        """
+        self.burst = burst
+        self.rate = rate
+        self.shard_size = max(1, max_keys // shards)
+        self._shards = [_Shard() for _ in range(shards)]
+
+    def _shard(self, key: Hashable) -> _Shard:
+        """
+        Retrieves the shard of a key.
+        """
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _tokens(self, bucket: List[float], now: float) -> float:
+        """
+        Refills a bucket up to now.
+
+        Args:
+          bucket (List[float]): The tokens and the time of the last refill.
+          now (float): The current monotonic time.
+
+        Returns:
+          float: The tokens of the bucket.
+        """
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[0] = tokens
+        bucket[1] = now
+        return tokens
+
+    def allow(self, key: Hashable) -> bool:
+        """
+        Checks if a credential check may run for a key.
+
+        Args:
+          key (Hashable): The key, e.g. client address and email.
+
+        Returns:
+          bool: False if the key failed too often recently.
+        """
+        if not self.burst:
+            return True
+        shard = self._shard(key)
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                return True
+            if self._tokens(bucket, time.monotonic()) >= 1:
+                return True
+            shard.rejected += 1
+            return False
+
+    def failure(self, key: Hashable, cost: float = 1):
+        """
+        Records a failed credential check.
+
+        Args:
+          key (Hashable): The key, e.g. client address and email.
+          cost (float): The tokens taken, lower for keys shared by many
+          legitimate checks (e.g. a client address alone).
+        """
+        if not self.burst:
+            return
+        shard = self._shard(key)
+        now = time.monotonic()
+        with shard.lock:
+            shard.failures += 1
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                bucket = shard.buckets[key] = [self.burst, now]
+                while len(shard.buckets) > self.shard_size:
+                    shard.buckets.popitem(last=False)
+                    shard.evictions += 1
+            else:
+                shard.buckets.move_to_end(key)
+                self._tokens(bucket, now)
+            bucket[0] = max(0, bucket[0] - cost)
+
+    def success(self, key: Hashable):
+        """
+        Forgets the failures of a key.
+
+        Args:
+          key (Hashable): The key, e.g. client address and email.
+        """
+        if not self.burst:
+            return
+        shard = self._shard(key)
+        with shard.lock:
+            shard.buckets.pop(key, None)
+
+    def stats(self) -> dict:
+        """
+        Counters of the throttle.
+
+        Returns:
+          dict: The keys remembered, failures, rejected checks and
+          evictions, summed over the shards.
+        """
+        result = {"keys": 0, "failures": 0, "rejected": 0, "evictions": 0}
+        for shard in self._shards:
+            with shard.lock:
+                result["keys"] += len(shard.buckets)
+                result["failures"] += shard.failures
+                result["rejected"] += shard.rejected
+                result["evictions"] += shard.evictions
+        return result
@@ -3,7 +3,7 @@
 """
 from email.policy import strict
 
-from flask import abort, jsonify
+from flask import abort, current_app, jsonify
 
 from api.v1.views import app_views
 
@@ -30,6 +30,48 @@ def stats() -> str:
     return jsonify(stats)
 
 
+@app_views.route("/stats/store", methods=["GET"], strict_slashes=False)
+def store_stats() -> str:
+    """GET /api/v1/stats/store
+    Return:
+      - the telemetry of the storage of each model: objects, file sizes,
+        load and write times, bytes written and index use
+    """
+    from models.user import User
+    from models.user_session import UserSession
+
+    return jsonify(
+        {cls.__name__: cls.stats() for cls in (User, UserSession)}
+    )
+
+
+@app_views.route("/stats/auth", methods=["GET"], strict_slashes=False)
+def auth_stats() -> str:
+    """GET /api/v1/stats/auth
+    Return:
+      - the counters of the authentication in use (e.g. the hit rate of
+        the Basic auth credential cache)
+    """
+    auth = current_app.extensions.get("auth")
+    return jsonify({} if auth is None else auth.stats())
+
+
+@app_views.route("/stats/sessions", methods=["GET"], strict_slashes=False)
+def session_stats() -> str:
+    """GET /api/v1/stats/sessions
+    Return:
+      - the metrics of the sessions: active sessions, creations and
+        destructions (total and per second over the last minute), lookups
+        of expired sessions, lookup latency histogram and store size
+      - 404 if the authentication in use has no sessions
+    """
+    auth = current_app.extensions.get("auth")
+    metrics = None if auth is None else auth.session_metrics()
+    if metrics is None:
+        abort(404)
+    return jsonify(metrics)
+
+
 @app_views.route("/unauthorized", strict_slashes=False)
 def unauthorized():
     """
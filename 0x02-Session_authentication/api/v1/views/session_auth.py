@@ -6,6 +6,7 @@ from os import getenv
 
 from flask import abort, jsonify, request
 
+from api.v1.auth.context import auth_context
 from api.v1.views import app_views
 from models.user import User
 
@@ -72,4 +73,8 @@ def logout_auth() -> str:
     if not auth.destroy_session(request):
         return False, abort(404)
 
+    context = auth_context()
+    if context is not None:
+        context.forget()
+
     return jsonify({}), 200
@@ -1,20 +1,72 @@
 #!/usr/bin/env python3
 """ Module of Users views
 """
-from flask import abort, jsonify, request
+from datetime import datetime, timezone
 
+from flask import Response, abort, current_app, jsonify, request
+
+from api.v1.auth.context import auth_context
 from api.v1.views import app_views
+from models.base import TIMESTAMP_FORMAT
 from models.user import User
 
+# Largest page of GET /api/v1/users
+MAX_LIMIT = 1000
+
+
+def _query_int(name: str, default: int = None) -> int:
+    """Non-negative integer query parameter, or `default` if absent
+
+    Raises ValueError if the parameter is not a non-negative integer.
+    """
+    value = request.args.get(name)
+    if value is None:
+        return default
+    if not (value.isascii() and value.isdigit()):
+        raise ValueError("{} must be a non-negative integer".format(name))
+    return int(value)
+
 
 @app_views.route("/users", methods=["GET"], strict_slashes=False)
 def view_all_users() -> str:
     """GET /api/v1/users
+    Query parameters (optional):
+      - limit: maximum number of users, at most MAX_LIMIT
+      - offset: number of users to skip
+      - after: ID of the last user of the previous page
+      - order_by: attribute to sort by (`-attribute` for descending order)
     Return:
-      - list of all User objects JSON represented
+      - list of User objects JSON represented
+      - 400 if a query parameter is invalid
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    try:
+        limit = _query_int("limit")
+        if limit is not None:
+            limit = min(limit, MAX_LIMIT)
+        offset = _query_int("offset", 0)
+        users = User.iter_search(
+            limit=limit,
+            offset=offset,
+            order_by=request.args.get("order_by"),
+            after=request.args.get("after"),
+        )
+        first = next(users, None)
+    except (AttributeError, ValueError) as e:
+        return jsonify({"error": "Invalid query: {}".format(e)}), 400
+
+    dumps = current_app.json.dumps
+
+    def generate():
+        """Stream the list one user at a time"""
+        if first is None:
+            yield "[]\n"
+            return
+        yield "[{}".format(dumps(first.to_json()))
+        for user in users:
+            yield ",{}".format(dumps(user.to_json()))
+        yield "]\n"
+
+    return Response(generate(), mimetype="application/json")
 
 
 @app_views.route("/users/<user_id>", methods=["GET"], strict_slashes=False)
@@ -30,9 +82,9 @@ def view_one_user(user_id: str = None) -> str:
         abort(404)
 
     if user_id == "me":
-        if request.current_user:
-            user = request.current_user
-            return jsonify(user.to_json())
+        context = auth_context()
+        if context is not None and context.user:
+            return jsonify(context.user.to_json())
 
         abort(404)
 
@@ -58,9 +110,93 @@ def delete_user(user_id: str = None) -> str:
     if user is None:
         abort(404)
     user.remove()
+    auth = current_app.extensions.get("auth")
+    if auth is not None:
+        auth.destroy_user_sessions(user.id)
     return jsonify({}), 200
 
 
+def _session_owner(user_id: str) -> User:
+    """
+    Retrieves the user whose sessions are requested: only the
+    authenticated user can list or revoke its own sessions.
+
+    Args:
+      user_id (str): The user ID, or `me`.
+
+    Returns:
+      User: The authenticated user; aborts with 404 if the authentication
+      has no sessions and 403 for the sessions of another user.
+    """
+    context = auth_context()
+    if context is None or context.user is None:
+        abort(404)
+    if user_id not in ("me", context.user.id):
+        abort(403)
+    return context.user
+
+
+def _timestamp(epoch: float) -> str:
+    """Format a time in seconds since the epoch like the User timestamps"""
+    if epoch is None:
+        return None
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime(
+        TIMESTAMP_FORMAT
+    )
+
+
+sessions_route = "/users/<user_id>/sessions"
+
+
+@app_views.route(sessions_route, methods=["GET"], strict_slashes=False)
+def view_user_sessions(user_id: str = None) -> str:
+    """GET /api/v1/users/:id/sessions
+    Path parameter:
+      - User ID (`me` or the authenticated user)
+    Return:
+      - list of the live sessions of the user, oldest first, without
+        their IDs: created_at, expires_at (null if it never expires) and
+        current (true for the session of the request)
+      - 403 for the sessions of another user
+      - 404 if the authentication doesn't list sessions
+    """
+    user = _session_owner(user_id)
+    sessions = current_app.extensions["auth"].user_sessions(user.id)
+    if sessions is None:
+        abort(404)
+    current = auth_context().session_id
+    return jsonify(
+        [
+            {
+                "created_at": _timestamp(session.created_at),
+                "expires_at": _timestamp(session.expires_at),
+                "current": session_id == current,
+            }
+            for session_id, session in sessions
+        ]
+    )
+
+
+@app_views.route(sessions_route, methods=["DELETE"], strict_slashes=False)
+def delete_user_sessions(user_id: str = None) -> str:
+    """DELETE /api/v1/users/:id/sessions
+    Path parameter:
+      - User ID (`me` or the authenticated user)
+    Return:
+      - JSON with the number of sessions destroyed, including the session
+        of the request (0 with session_token_auth, which doesn't count
+        the tokens it revokes)
+      - 403 for the sessions of another user
+      - 404 if the authentication has no sessions
+    """
+    user = _session_owner(user_id)
+    destroyed = current_app.extensions["auth"].destroy_user_sessions(user.id)
+    if destroyed is None:
+        abort(404)
+    auth_context().forget()
+    return jsonify({"destroyed": destroyed}), 200
+
+
 @app_views.route("/users", methods=["POST"], strict_slashes=False)
 def create_user() -> str:
     """POST /api/v1/users/
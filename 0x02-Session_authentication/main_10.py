@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+""" Main 10: journal of UserSession, replayed and compacted
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+FILE = ".db_UserSession.json"
+JOURNAL = FILE + ".log"
+
+
+def other_process(root: str, code: str, compact_bytes: int = None):
+    """Run code in another process, with a smaller journal if given"""
+    if compact_bytes is not None:
+        code = (
+            "from models.engine.file_storage import FileStorage; "
+            "FileStorage.JOURNAL_COMPACT_BYTES = {}; ".format(compact_bytes)
+            + code
+        )
+    code = "from models.user_session import UserSession; " + code
+    process = subprocess.run(
+        [sys.executable, "-c", code],
+        env=dict(os.environ, PYTHONPATH=root),
+        capture_output=True,
+        text=True,
+    )
+    assert process.returncode == 0, process.stderr
+
+
+def main(root: str):
+    """Check that changes are appended, replayed and compacted"""
+    from models.user_session import UserSession
+
+    UserSession.save_many(
+        [UserSession(user_id="u", session_id=str(i)) for i in range(10)]
+    )
+    print(
+        "file: {}, journal: {}".format(
+            os.path.exists(FILE), os.path.exists(JOURNAL)
+        )
+    )
+
+    # Single changes are appended to the journal
+    other_process(
+        root,
+        "[UserSession(user_id='v', session_id='v' + str(i)).save() "
+        "for i in range(5)]; "
+        "UserSession.search({'session_id': '0'})[0].remove()",
+    )
+    with open(JOURNAL) as f:
+        lines = f.read().splitlines()
+    print("journal lines: {}".format(len(lines)))
+    assert len(lines) == 6 and json.loads(lines[-1])[1] is None
+
+    # This process only replays the lines it has not read: no new load
+    loads = UserSession.stats()["loads"]
+    assert UserSession.count() == 14
+    assert UserSession.search({"session_id": "0"}) == []
+    assert UserSession.stats()["loads"] == loads
+    print("replayed without loading: {}".format(UserSession.count()))
+
+    # A line cut by a crash is skipped, then terminated by the next append
+    with open(JOURNAL, "a") as f:
+        f.write('["cut", {"id": "cu')
+    other_process(
+        root, "UserSession(user_id='w', session_id='after-crash').save()"
+    )
+    assert UserSession.count() == 15
+    assert UserSession.search({"session_id": "after-crash"})[0].user_id == "w"
+    print("after a cut line: {}".format(UserSession.count()))
+
+    # Once the journal outgrows the file, the file is rewritten with it
+    other_process(
+        root,
+        "[UserSession(user_id='x', session_id='x' + str(i)).save() "
+        "for i in range(40)]",
+        compact_bytes=1000,
+    )
+    journal_bytes = os.path.getsize(JOURNAL) if os.path.exists(JOURNAL) else 0
+    print("journal after compaction: {} bytes".format(journal_bytes))
+    assert journal_bytes < os.path.getsize(FILE)
+    with open(FILE) as f:
+        assert len(json.load(f)) > 15
+    assert UserSession.count() == 55
+    assert len(UserSession.search({"user_id": "x"})) == 40
+    print("OK")
+
+
+if __name__ == "__main__":
+    root = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(tempfile.mkdtemp())
+    os.environ.pop("STORAGE_TYPE", None)
+    os.environ.pop("STORAGE_SHARDS", None)
+    main(root)
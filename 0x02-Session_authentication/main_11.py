@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+""" Main 11: session tokens rejected by SessionTokenAuth
+"""
+import os
+import tempfile
+import time
+from collections import namedtuple
+
+Request = namedtuple("Request", ("cookies",))
+
+
+def main():
+    """Check that tampered, expired, revoked and foreign tokens fail"""
+    from api.v1.auth.session_token_auth import SessionTokenAuth
+
+    auth = SessionTokenAuth()
+    token = auth.create_session("bob")
+    assert auth.user_id_for_session_id(token) == "bob"
+
+    # Another user ID, or another signature, breaks the signature
+    user_id, rest = token.split(".", 1)
+    payload, _, signature = token.rpartition(".")
+    flipped = "A" if signature[0] != "A" else "B"
+    tampered = [
+        "alice." + rest,
+        payload + "." + flipped + signature[1:],
+        payload + ".",
+        payload,
+    ]
+    results = [auth.user_id_for_session_id(bad) for bad in tampered]
+    print("tampered tokens: {}".format(results))
+    assert results == [None] * 4
+    assert auth.stats()["session_tokens"]["rejected"] == 4
+
+    # A token signed with the right key but past its expiration
+    payload = "bob.{}.{}.{}".format(
+        int(time.time() * 1000) - 5000, int(time.time()) - 1, "t" * 32
+    )
+    expired = "{}.{}".format(payload, auth._sign(payload))
+    print("expired token: {}".format(auth.user_id_for_session_id(expired)))
+    assert auth.user_id_for_session_id(expired) is None
+    assert auth.stats()["session_tokens"]["expired"] == 2
+
+    # A revoked token, then every token of the user
+    assert auth.destroy_session(Request({"_my_session_id": token}))
+    print("revoked token: {}".format(auth.user_id_for_session_id(token)))
+    assert auth.user_id_for_session_id(token) is None
+    assert not auth.destroy_session(Request({"_my_session_id": token}))
+    other = auth.create_session("bob")
+    assert auth.user_id_for_session_id(other) == "bob"
+    assert auth.destroy_user_sessions("bob") == 0
+    assert auth.user_id_for_session_id(other) is None
+    assert auth.stats()["session_tokens"]["revoked"] == 3
+    assert auth.user_id_for_session_id(auth.create_session("alice")) == (
+        "alice"
+    )
+
+    # A token signed with another key
+    os.environ["SESSION_TOKEN_SECRET"] = "another secret"
+    foreign = SessionTokenAuth().create_session("bob")
+    print("other key: {}".format(auth.user_id_for_session_id(foreign)))
+    assert auth.user_id_for_session_id(foreign) is None
+    print("OK")
+
+
+if __name__ == "__main__":
+    os.chdir(tempfile.mkdtemp())
+    os.environ.update(
+        SESSION_NAME="_my_session_id",
+        SESSION_STORE="memory",
+        SESSION_DURATION="0",
+        SESSION_EXPIRE_INTERVAL="0",
+        SESSION_TOKEN_SECRET="secret",
+    )
+    main()
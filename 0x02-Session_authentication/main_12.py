@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+""" Main 12: throttle of failed Basic auth checks
+"""
+import base64
+import os
+import tempfile
+import time
+from collections import namedtuple
+
+Request = namedtuple("Request", ("headers", "remote_addr"))
+
+
+def request(email: str, password: str, address: str) -> Request:
+    """Request with Basic auth credentials from an address"""
+    credentials = "{}:{}".format(email, password).encode("utf-8")
+    header = "Basic " + base64.b64encode(credentials).decode("ascii")
+    return Request({"Authorization": header}, address)
+
+
+def main():
+    """Check that failing clients are rejected, and only them"""
+    from api.v1.auth.basic_auth import BasicAuth
+    from api.v1.auth.throttle import FailureThrottle
+    from models.user import User
+
+    user = User(email="bob@hbtn.io")
+    user.password = "pwd"
+    user.save()
+    auth = BasicAuth()
+
+    # 2 failures go through, then even the right password is rejected
+    bad = request("bob@hbtn.io", "bad", "1.1.1.1")
+    for _ in range(2):
+        assert auth.current_user(bad) is None
+    good = request("bob@hbtn.io", "pwd", "1.1.1.1")
+    print("after 2 failures: {}".format(auth.current_user(good)))
+    assert auth.current_user(good) is None
+    assert auth.throttle.stats()["rejected"] == 2
+
+    # Another client is not throttled, and a success forgets its failures
+    other = request("bob@hbtn.io", "pwd", "2.2.2.2")
+    assert auth.current_user(other._replace(headers=bad.headers)) is None
+    assert auth.current_user(other).id == user.id
+    # Left: both keys of the first client, the address of the other
+    assert auth.throttle.stats()["keys"] == 3
+    print("other client: {}".format(auth.current_user(other).email))
+
+    # Tokens are refilled at the rate, up to the burst
+    throttle = FailureThrottle(burst=2, rate=20)
+    for _ in range(2):
+        throttle.failure("key")
+    assert not throttle.allow("key")
+    time.sleep(0.1)
+    assert throttle.allow("key")
+    print("refilled after 0.1s: {}".format(throttle.allow("key")))
+
+    # Only max_keys keys are remembered, the least recently used evicted
+    throttle = FailureThrottle(burst=1, rate=0.001, max_keys=4, shards=1)
+    for key in range(5):
+        throttle.failure(key)
+    assert throttle.allow(0) and not throttle.allow(4)
+    assert throttle.stats()["evictions"] == 1
+    print("keys remembered: {}".format(throttle.stats()["keys"]))
+    assert throttle.stats()["keys"] == 4
+    print("OK")
+
+
+if __name__ == "__main__":
+    os.chdir(tempfile.mkdtemp())
+    os.environ.pop("STORAGE_TYPE", None)
+    os.environ.update(
+        BASIC_AUTH_THROTTLE_BURST="2",
+        BASIC_AUTH_THROTTLE_RATE="0.001",
+        BASIC_AUTH_CACHE_SIZE="0",
+    )
+    main()
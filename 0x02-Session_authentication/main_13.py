@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+""" Main 13: cached Basic auth credentials invalidated by user changes
+"""
+import base64
+import os
+import subprocess
+import sys
+import tempfile
+from collections import namedtuple
+
+Request = namedtuple("Request", ("headers", "remote_addr"))
+
+
+def request(email: str, password: str) -> Request:
+    """Request with Basic auth credentials"""
+    credentials = "{}:{}".format(email, password).encode("utf-8")
+    header = "Basic " + base64.b64encode(credentials).decode("ascii")
+    return Request({"Authorization": header}, "127.0.0.1")
+
+
+def main(root: str):
+    """Check that a cached user is only served while it is unchanged"""
+    from api.v1.auth.basic_auth import BasicAuth
+    from models.user import User
+
+    user = User(email="bob@hbtn.io")
+    user.password = "pwd"
+    user.save()
+    auth = BasicAuth()
+    bob = request("bob@hbtn.io", "pwd")
+
+    assert auth.current_user(bob).id == user.id
+    assert auth.current_user(bob).id == user.id
+    stats = auth.credential_cache.stats()
+    print("hits: {}, misses: {}".format(stats["hits"], stats["misses"]))
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+    # A new password in this process: the old one no longer works
+    user.password = "new"
+    user.save()
+    print("old password: {}".format(auth.current_user(bob)))
+    assert auth.current_user(bob) is None
+    assert auth.credential_cache.stats()["invalidations"] == 1
+    assert auth.current_user(request("bob@hbtn.io", "new")).id == user.id
+
+    # A new password set by another process (another worker)
+    bob = request("bob@hbtn.io", "new")
+    assert auth.current_user(bob).id == user.id
+    code = (
+        "from models.user import User; "
+        "user = User.get('{}'); user.password = 'other'; user.save()"
+    ).format(user.id)
+    other = subprocess.run(
+        [sys.executable, "-c", code],
+        env=dict(os.environ, PYTHONPATH=root),
+        capture_output=True,
+        text=True,
+    )
+    assert other.returncode == 0, other.stderr
+    print("password changed elsewhere: {}".format(auth.current_user(bob)))
+    assert auth.current_user(bob) is None
+    assert auth.credential_cache.stats()["invalidations"] == 2
+
+    # A new email, or a removed user
+    bob = request("bob@hbtn.io", "other")
+    assert auth.current_user(bob).id == user.id
+    user = User.get(user.id)
+    user.email = "alice@hbtn.io"
+    user.save()
+    assert auth.current_user(bob) is None
+    alice = request("alice@hbtn.io", "other")
+    assert auth.current_user(alice).id == user.id
+    user.remove()
+    print("removed user: {}".format(auth.current_user(alice)))
+    assert auth.current_user(alice) is None
+    assert auth.credential_cache.stats()["invalidations"] == 4
+    print("OK")
+
+
+if __name__ == "__main__":
+    root = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(tempfile.mkdtemp())
+    os.environ.pop("STORAGE_TYPE", None)
+    os.environ.pop("BASIC_AUTH_CACHE_SIZE", None)
+    main(root)
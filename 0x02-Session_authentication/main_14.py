@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+""" Main 14: concurrent identical Basic auth checks run once
+"""
+import base64
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+Request = namedtuple("Request", ("headers", "remote_addr"))
+
+
+def wait_for(condition, timeout: float = 5):
+    """Wait until a condition holds"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def main():
+    """Check that concurrent calls of a key share one run and its outcome"""
+    from api.v1.auth.basic_auth import BasicAuth
+    from api.v1.auth.single_flight import SingleFlight
+    from models.user import User
+
+    flight = SingleFlight()
+    release = threading.Event()
+    runs = []
+
+    def slow():
+        """Call held until released"""
+        runs.append(1)
+        release.wait()
+        return object()
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(flight.do("k", slow)))
+        for _ in range(5)
+    ]
+    threads[0].start()
+    wait_for(lambda: runs)
+    for thread in threads[1:]:
+        thread.start()
+    wait_for(lambda: flight.stats()["coalesced"] == 4)
+    # Another key does not wait for the call in flight
+    assert flight.do("other", lambda: "other") == "other"
+    release.set()
+    for thread in threads:
+        thread.join()
+    print("runs: {}, results: {}".format(len(runs), len(set(results))))
+    assert len(runs) == 1 and len(results) == 5 and len(set(results)) == 1
+    assert flight.stats() == {"calls": 2, "coalesced": 4, "in_flight": 0}
+
+    # The waiting callers get the exception too, and nothing is kept
+    release.clear()
+    errors = []
+
+    def failing():
+        """Call held until released, then failing"""
+        release.wait()
+        raise ValueError("failed")
+
+    def call():
+        """Call `failing`, keeping its exception"""
+        try:
+            flight.do("k", failing)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: flight.stats()["coalesced"] == 6)
+    release.set()
+    for thread in threads:
+        thread.join()
+    print("errors: {}".format(len(errors)))
+    assert len(errors) == 3 and flight.stats()["in_flight"] == 0
+    assert flight.do("k", lambda: "again") == "again"
+
+    # Concurrent requests with the same credentials
+    user = User(email="bob@hbtn.io")
+    user.password = "pwd"
+    user.save()
+    auth = BasicAuth()
+    header = "Basic " + base64.b64encode(b"bob@hbtn.io:pwd").decode("ascii")
+    bob = Request({"Authorization": header}, "127.0.0.1")
+    users = []
+    threads = [
+        threading.Thread(target=lambda: users.append(auth.current_user(bob)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = auth.single_flight.stats()
+    print("checks run: {}".format(stats["calls"]))
+    assert [u.id for u in users] == [user.id] * 8
+    assert stats["calls"] + stats["coalesced"] == 8
+    print("OK")
+
+
+if __name__ == "__main__":
+    os.chdir(tempfile.mkdtemp())
+    os.environ.pop("STORAGE_TYPE", None)
+    os.environ["BASIC_AUTH_CACHE_SIZE"] = "0"
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+""" Main 15: sliding expiration of sessions, moved by their uses
+"""
+import os
+import tempfile
+import time
+
+
+def main():
+    """Check that used sessions outlive the duration, and others do not"""
+    from api.v1.auth.session_db_auth import SessionDBAuth
+    from api.v1.auth.session_exp_auth import SessionExpAuth
+    from models.user_session import UserSession
+
+    start = time.time()
+    auth = SessionExpAuth()
+    used = auth.create_session("bob")
+    unused = auth.create_session("alice")
+    db_auth = SessionDBAuth()
+    db_used = db_auth.create_session("bob")
+    db_unused = db_auth.create_session("alice")
+    os.environ["SESSION_SLIDING"] = "0"
+    fixed_auth = SessionExpAuth()
+    fixed = fixed_auth.create_session("bob")
+    os.environ["SESSION_SLIDING"] = "1"
+
+    # Past SESSION_TOUCH_INTERVAL, a use moves the expiration, once
+    time.sleep(2.5)
+    for _ in range(3):
+        assert auth.user_id_for_session_id(used) == "bob"
+        assert db_auth.user_id_for_session_id(db_used) == "bob"
+        assert fixed_auth.user_id_for_session_id(fixed) == "bob"
+    print("touches: {}".format(auth.stats()["touches"]))
+    assert auth.stats()["touches"] == 1
+    assert fixed_auth.stats()["touches"] == 0
+    # The last uses of UserSession objects are saved once per interval
+    assert db_auth.stats()["touch_writes"] == 1
+
+    # Past SESSION_DURATION, only the used sessions are valid
+    time.sleep(max(0, start + 6.2 - time.time()))
+    print("used: {}".format(auth.user_id_for_session_id(used)))
+    assert auth.user_id_for_session_id(used) == "bob"
+    print("unused: {}".format(auth.user_id_for_session_id(unused)))
+    assert auth.user_id_for_session_id(unused) is None
+    print("fixed: {}".format(fixed_auth.user_id_for_session_id(fixed)))
+    assert fixed_auth.user_id_for_session_id(fixed) is None
+
+    # Another worker, without cache, reads the last use from the storage
+    other_auth = SessionDBAuth()
+    assert other_auth.user_id_for_session_id(db_used) == "bob"
+    assert other_auth.user_id_for_session_id(db_unused) is None
+    assert UserSession.get(db_used).updated_at > UserSession.get(
+        db_unused
+    ).updated_at
+    print("OK")
+
+
+if __name__ == "__main__":
+    os.chdir(tempfile.mkdtemp())
+    os.environ.pop("STORAGE_TYPE", None)
+    os.environ.update(
+        SESSION_STORE="memory",
+        SESSION_DURATION="5",
+        SESSION_SLIDING="1",
+        SESSION_TOUCH_INTERVAL="1",
+        SESSION_EXPIRE_INTERVAL="0",
+    )
+    main()
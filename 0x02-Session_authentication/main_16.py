@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+""" Main 16: purge of the expired UserSession objects
+"""
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+
+def sessions(prefix: str, count: int, age: int, idle: int = None) -> list:
+    """UserSession objects created `age` seconds ago, last used `idle`
+    seconds ago (default: when created)"""
+    from models.base import TIMESTAMP_FORMAT
+    from models.user_session import UserSession
+
+    now = datetime.utcnow()
+    created_at = (now - timedelta(seconds=age)).strftime(TIMESTAMP_FORMAT)
+    updated_at = created_at
+    if idle is not None:
+        updated_at = (now - timedelta(seconds=idle)).strftime(
+            TIMESTAMP_FORMAT
+        )
+    return [
+        UserSession(
+            id="{}-{}".format(prefix, i),
+            session_id="{}-{}".format(prefix, i),
+            user_id=prefix,
+            created_at=created_at,
+            updated_at=updated_at,
+        )
+        for i in range(count)
+    ]
+
+
+def main(root: str):
+    """Check that only the expired sessions are purged, in one write"""
+    from api.v1.auth.session_db_auth import SessionDBAuth
+    from models.user_session import UserSession
+
+    UserSession.save_many(
+        sessions("old", 30, 7200)
+        + sessions("new", 10, 60)
+        + sessions("used", 5, 7200, idle=60)
+    )
+    # With sliding expiration, the last use counts instead of the creation
+    os.environ["SESSION_SLIDING"] = "1"
+    auth = SessionDBAuth()
+    writes = UserSession.stats()["writes"]
+    print("purged (sliding): {}".format(auth.purge_expired()))
+    assert UserSession.count() == 15
+    assert UserSession.stats()["writes"] == writes + 1
+    assert UserSession.search({"user_id": "old"}) == []
+    assert auth.purge_expired() == 0
+
+    os.environ["SESSION_SLIDING"] = "0"
+    print("purged: {}".format(SessionDBAuth().purge_expired()))
+    assert UserSession.count() == 10
+    assert UserSession.search({"user_id": "used"}) == []
+
+    # The command, with another duration
+    UserSession.save_many(sessions("old", 30, 7200))
+    command = [sys.executable, "-m", "api.v1.auth.purge_sessions"]
+    env = dict(os.environ, PYTHONPATH=root)
+    purge = subprocess.run(
+        command + ["--duration", "30"],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    print(purge.stdout.strip())
+    assert purge.returncode == 0, purge.stderr
+    assert purge.stdout.startswith("purged 40 of 40 sessions")
+    assert UserSession.count() == 0
+
+    # Sessions that never expire are never purged
+    env["SESSION_DURATION"] = "0"
+    purge = subprocess.run(command, env=env, capture_output=True, text=True)
+    print("without duration: exit {}".format(purge.returncode))
+    assert purge.returncode == 2 and "never expire" in purge.stderr
+    print("OK")
+
+
+if __name__ == "__main__":
+    root = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(tempfile.mkdtemp())
+    os.environ.pop("STORAGE_TYPE", None)
+    os.environ.update(
+        SESSION_DURATION="3600",
+        SESSION_SLIDING="0",
+        SESSION_EXPIRE_INTERVAL="0",
+        SESSION_PURGE_INTERVAL="0",
+    )
+    main(root)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+""" Main 17: bulk import and export of users from the command line
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+def bulk(root: str, *args: str) -> subprocess.CompletedProcess:
+    """Run `python3 -m models.bulk` with arguments"""
+    process = subprocess.run(
+        [sys.executable, "-m", "models.bulk"] + list(args),
+        env=dict(os.environ, PYTHONPATH=root),
+        capture_output=True,
+        text=True,
+    )
+    assert process.returncode == 0, process.stderr
+    return process
+
+
+def main(root: str):
+    """Check an import with bad rows, and an export imported back"""
+    from models.user import User
+
+    taken = User(email="taken@hbtn.io")
+    taken.password = "pwd"
+    taken.save()
+    rows = [
+        {"email": "bob@hbtn.io", "password": "pwd", "first_name": "Bob"},
+        {"email": "bob@hbtn.io", "password": "other"},
+        "not json",
+        {"email": "alice@hbtn.io", "password": 123},
+        {"email": "carol@hbtn.io"},
+        {"email": "dave@hbtn.io", "_password": "not hex"},
+        {"email": "erin@hbtn.io", "password": "p", "created_at": "today"},
+        {"id": "frank", "email": "frank@hbtn.io", "password": "pwd"},
+        {"id": "frank", "email": "frank2@hbtn.io", "password": "pwd"},
+        {"email": "taken@hbtn.io", "password": "pwd"},
+    ]
+    with open("users.jsonl", "w") as f:
+        for row in rows:
+            f.write((row if type(row) is str else json.dumps(row)) + "\n")
+    errors = bulk(root, "import", "users.jsonl", "--workers", "2").stderr
+    print(errors.strip())
+    skipped = [line for line in errors.splitlines() if "skipped" in line]
+    assert [line.split(":")[0] for line in skipped[:-1]] == [
+        "line {}".format(i) for i in (2, 3, 4, 5, 6, 7, 9, 10)
+    ]
+    assert skipped[-1] == "skipped 8 rows"
+
+    User.load_from_file()
+    assert User.count() == 3
+    bob = User.search({"email": "bob@hbtn.io"})[0]
+    assert bob.is_valid_password("pwd") and bob.first_name == "Bob"
+    assert User.get("frank").email == "frank@hbtn.io"
+
+    # An export imported into an empty store gives the same users
+    bulk(root, "export", "users.csv")
+    for path in os.listdir("."):
+        if path.startswith(".db_User"):
+            os.remove(path)
+    bulk(root, "import", "users.csv", "--workers", "1")
+    User.load_from_file()
+    print("users imported back: {}".format(User.count()))
+    assert User.count() == 3
+    assert User.get(bob.id).is_valid_password("pwd")
+    assert User.get(taken.id).created_at == taken.created_at.replace(
+        microsecond=0
+    )
+
+    # Importing the export again only replaces the same users
+    bulk(root, "import", "users.csv")
+    User.load_from_file()
+    assert User.count() == 3
+    print("OK")
+
+
+if __name__ == "__main__":
+    root = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(tempfile.mkdtemp())
+    os.environ.pop("STORAGE_TYPE", None)
+    os.environ.pop("STORAGE_SHARDS", None)
+    main(root)
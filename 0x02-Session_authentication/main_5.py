@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+""" Main 5: values of unexpected types in indexed attributes
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+
+def main(root: str):
+    """Check searches and orders with values of other types"""
+    from api.v1.app import app
+    from models.user import User
+
+    bob = User(email="bob@hbtn.io")
+    bob.password = "pwd"
+    bob.save()
+
+    client = app.test_client()
+    res = client.post("/api/v1/users", json={"email": 123, "password": "p"})
+    print("POST with an int email: {}".format(res.status_code))
+    assert User.count() == 2
+
+    assert User.search({"email": 5}) == []
+    assert User.search({"created_at": "2024-01-01T00:00:00"}) == []
+    assert User.search({"email": "bob@hbtn.io"}) == [bob]
+    assert User.search({"email": {"startswith": "bob"}}) == [bob]
+    assert User.search({"email": 123})[0].email == 123
+    assert User.search({"email": {"gt": 100}})[0].email == 123
+    print("searches: OK")
+
+    res = client.get("/api/v1/users?order_by=email")
+    print("GET ordered by email: {} {}".format(res.status_code, len(res.json)))
+    assert res.status_code == 200 and len(res.json) == 2
+
+    # Another process loads the file holding both users
+    code = (
+        "from models.user import User; "
+        "print(User.count(), User.search({'email': 'bob@hbtn.io'}) != [])"
+    )
+    restart = subprocess.run(
+        [sys.executable, "-c", code],
+        env=dict(os.environ, PYTHONPATH=root),
+        capture_output=True,
+        text=True,
+    )
+    print("restart: {}".format(restart.stdout.strip() or restart.stderr))
+    assert restart.stdout.split() == ["2", "True"]
+
+
+if __name__ == "__main__":
+    root = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(tempfile.mkdtemp())
+    main(root)
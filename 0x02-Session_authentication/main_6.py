@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+""" Main 6: SQLite storage shared by processes
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+
+def main(root: str):
+    """Check that rows changed by another process are read again"""
+    from models.user import User
+    from models.user_session import UserSession
+
+    user = User(email="bob@hbtn.io")
+    user.save()
+    user_session = UserSession(user_id=user.id, session_id="abc")
+    user_session.save()
+
+    # Both are cached by this process
+    assert UserSession.get(user_session.id) is user_session
+    assert UserSession.search({"session_id": "abc"}) == [user_session]
+    assert User.get(user.id) is user
+
+    # Another process (another worker) changes them
+    code = (
+        "from models.user import User; "
+        "from models.user_session import UserSession; "
+        "UserSession.search({{'session_id': 'abc'}})[0].remove(); "
+        "user = User.get('{}'); user.email = 'alice@hbtn.io'; user.save()"
+    ).format(user.id)
+    other = subprocess.run(
+        [sys.executable, "-c", code],
+        env=dict(os.environ, PYTHONPATH=root),
+        capture_output=True,
+        text=True,
+    )
+    assert other.returncode == 0, other.stderr
+
+    print("removed session: {}".format(UserSession.get(user_session.id)))
+    assert UserSession.get(user_session.id) is None
+    assert UserSession.search({"session_id": "abc"}) == []
+    assert UserSession.count() == 0
+
+    print("updated email: {}".format(User.get(user.id).email))
+    assert User.get(user.id).email == "alice@hbtn.io"
+    assert User.search({"email": "alice@hbtn.io"})[0].email == "alice@hbtn.io"
+
+    # An unchanged row keeps its cached object
+    assert User.get(user.id) is User.get(user.id)
+    print("OK")
+
+
+if __name__ == "__main__":
+    root = os.path.dirname(os.path.abspath(__file__))
+    os.chdir(tempfile.mkdtemp())
+    os.environ["STORAGE_TYPE"] = "sqlite"
+    main(root)
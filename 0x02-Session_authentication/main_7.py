@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+""" Main 7: migration of a model file to shards
+"""
+import glob
+import os
+import subprocess
+import sys
+import tempfile
+
+root = os.path.dirname(os.path.abspath(__file__))
+os.chdir(tempfile.mkdtemp())
+
+
+def run(shards: int, code: str) -> str:
+    """Run code in a new process storing models in `shards` files"""
+    env = dict(os.environ, PYTHONPATH=root, STORAGE_SHARDS=str(shards))
+    env.pop("STORAGE_TYPE", None)
+    process = subprocess.run(
+        [sys.executable, "-c", "from models.user import User; " + code],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    assert process.returncode == 0, process.stderr
+    return process.stdout.strip()
+
+
+run(1, "[User(email='u{}@hbtn.io').save() for u in range(3)]")
+print("unsharded files: {}".format(sorted(glob.glob(".db_User*"))))
+
+# The first load with shards imports the unsharded file
+print("users in 4 shards: {}".format(run(4, "print(User.count())")))
+assert run(4, "print(User.count())") == "3"
+print("shard files: {}".format(len(glob.glob(".db_User.*.json"))))
+assert glob.glob(".db_User.*.json")
+
+# Removed objects are not imported again from the unsharded file
+run(4, "User.remove_many(User.all())")
+print("users after removal: {}".format(run(4, "print(User.count())")))
+assert run(4, "print(User.count())") == "0"
+
+run(4, "User(email='new@hbtn.io').save()")
+assert run(4, "print([u.email for u in User.all()])") == "['new@hbtn.io']"
+
+# Journaled models migrate their journal too
+code = (
+    "from models.user_session import UserSession; "
+    "[UserSession(session_id=str(i)).save() for i in range(20)]; "
+    "UserSession.search({'session_id': '0'})[0].remove(); "
+)
+run(1, code)
+assert os.path.exists(".db_UserSession.json.log")
+code = (
+    "from models.user_session import UserSession; "
+    "print(UserSession.count(), UserSession.search({'session_id': '0'}))"
+)
+print("sessions in 4 shards: {}".format(run(4, code)))
+assert run(4, code) == "19 []"
+print("OK")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+""" Main 8: revoked tokens in a served session store with limits
+"""
+import os
+import socket
+import tempfile
+import time
+from collections import namedtuple
+from multiprocessing import Process
+
+Request = namedtuple("Request", ("cookies",))
+
+
+def main():
+    """Check that revocations are neither evicted nor kept forever"""
+    from api.v1.auth.session_store.server import RemoteSessionStore, serve
+    from api.v1.auth.session_token_auth import SessionTokenAuth
+
+    server = Process(target=serve, daemon=True)
+    server.start()
+    try:
+        for _ in range(100):
+            try:
+                len(RemoteSessionStore())
+                break
+            except (ConnectionError, EOFError):
+                time.sleep(0.05)
+
+        auth = SessionTokenAuth()
+        tokens = [
+            auth.create_session("user-{}".format(i % 2)) for i in range(6)
+        ]
+        for token in tokens:
+            assert auth.destroy_session(Request({"_my_session_id": token}))
+
+        # The limits of the server (2 sessions, 1 per user) evict nothing
+        revoked = [auth.user_id_for_session_id(token) for token in tokens]
+        print("revoked tokens still valid: {}".format(6 - revoked.count(None)))
+        assert revoked == [None] * 6
+
+        # Revocations expire with the tokens, even with SESSION_DURATION=0
+        expires = {session.expires_at for _, session in auth.store.items()}
+        print("revocations never expiring: {}".format(None in expires))
+        assert None not in expires
+    finally:
+        server.terminate()
+        server.join()
+    print("OK")
+
+
+if __name__ == "__main__":
+    os.chdir(tempfile.mkdtemp())
+    os.environ.update(
+        SESSION_NAME="_my_session_id",
+        SESSION_STORE="server",
+        SESSION_STORE_AUTHKEY="secret",
+        SESSION_MAX="2",
+        SESSION_MAX_PER_USER="1",
+        SESSION_DURATION="0",
+        SESSION_TOKEN_SECRET="secret",
+    )
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    os.environ["SESSION_STORE_ADDRESS"] = "127.0.0.1:{}".format(port)
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+""" Main 9: processes writing the same model files at once
+"""
+import glob
+import os
+import subprocess
+import sys
+import tempfile
+
+root = os.path.dirname(os.path.abspath(__file__))
+os.chdir(tempfile.mkdtemp())
+
+WRITER = """
+import sys
+from models.user import User
+from models.user_session import UserSession
+
+name = sys.argv[1]
+for i in range(30):
+    User(email="{}-{}@hbtn.io".format(name, i)).save()
+    UserSession(user_id=name, session_id="{}-{}".format(name, i)).save()
+# Saves and removals of a batch
+users = [User(email="{}-batch-{}@hbtn.io".format(name, i)) for i in range(20)]
+User.save_many(users)
+User.remove_many(users[:10])
+for user_session in UserSession.search({"user_id": name})[:5]:
+    user_session.remove()
+"""
+
+
+def writers(count: int, shards: int):
+    """Run `count` writer processes at once on `shards` files per model"""
+    env = dict(os.environ, PYTHONPATH=root, STORAGE_SHARDS=str(shards))
+    env.pop("STORAGE_TYPE", None)
+    processes = [
+        subprocess.Popen(
+            [sys.executable, "-c", WRITER, "{}-{}".format(shards, i)],
+            env=env,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        for i in range(count)
+    ]
+    for process in processes:
+        assert process.wait() == 0, process.stderr.read()
+
+
+for shards in (1, 4):
+    writers(4, shards)
+
+    os.environ["STORAGE_SHARDS"] = str(shards)
+    code = (
+        "from models.user import User; "
+        "from models.user_session import UserSession; "
+        "print(User.count(), UserSession.count())"
+    )
+    counts = subprocess.run(
+        [sys.executable, "-c", code],
+        env=dict(os.environ, PYTHONPATH=root),
+        capture_output=True,
+        text=True,
+    ).stdout.split()
+    print("{} shard(s): users and sessions {}".format(shards, counts))
+    # No change of a writer is lost: 4 * (30 + 10) users, 4 * 25 sessions
+    assert counts == ["160", "100"], counts
+    for path in glob.glob(".db_*.json"):
+        os.remove(path)
+    for path in glob.glob(".db_*.json.log"):
+        os.remove(path)
+print("OK")
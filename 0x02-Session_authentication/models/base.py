@@ -1,38 +1,102 @@
 #!/usr/bin/env python3
 """ Base module
 """
-import json
 import uuid
 from datetime import datetime
-from os import path
-from typing import Iterable, List, TypeVar
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator, List, TypeVar
+
+from models.engine import new_storage
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+storage = new_storage(DATA)
+
+
+@lru_cache(maxsize=4096)
+def _parse_timestamp(value: str) -> datetime:
+    """Parse a TIMESTAMP_FORMAT string
+
+    Timestamps have a one second resolution, so records saved together
+    share the same (immutable) datetime object instead of one each.
+    """
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+@lru_cache(maxsize=4096)
+def _format_timestamp(value: datetime) -> str:
+    """Format a datetime with TIMESTAMP_FORMAT
+
+    Loaded and imported objects share their datetimes (see
+    `_parse_timestamp`), so writing a model formats each one once.
+    """
+    return value.strftime(TIMESTAMP_FORMAT)
+
+
+def _timestamp_or_now(value: str) -> datetime:
+    """Parse a serialized timestamp, defaulting to the current time"""
+    if value is None:
+        return datetime.utcnow()
+    return _parse_timestamp(value)
+
+
+def _make_loader(cls) -> Callable[[dict], TypeVar("Base")]:
+    """Generate a constructor building a `cls` from its JSON dictionary
+
+    The generated function assigns every slot with straight-line code and
+    skips `__init__`, which is what makes `load_from_file` cheap.
+    """
+    namespace = {"new": object.__new__, "cls": cls}
+    lines = ["def from_json(obj_json):", "    obj = new(cls)"]
+    for i, name in enumerate(cls._fields):
+        value = "obj_json.get({!r})".format(name)
+        decoder = cls._decoders.get(name)
+        if decoder is not None:
+            namespace["decode_{}".format(i)] = decoder
+            value = "decode_{}({})".format(i, value)
+        lines.append("    obj.{} = {}".format(name, value))
+    lines.append("    return obj")
+    exec("\n".join(lines), namespace)
+    return namespace["from_json"]
 
 
 class Base:
     """Base class"""
 
+    __slots__ = ("id", "created_at", "updated_at")
+    _fields = __slots__
+    _indexes = ("created_at", "updated_at")
+    # Whether the file storage appends changes to a journal (see
+    # FileStorage) instead of rewriting the file of the model
+    _journaled = False
+    _decoders = {
+        "created_at": _timestamp_or_now,
+        "updated_at": _timestamp_or_now,
+    }
+
+    def __init_subclass__(cls, **kwargs):
+        """Collect the slotted fields of a model and build its loader"""
+        super().__init_subclass__(**kwargs)
+        fields = []
+        for klass in reversed(cls.__mro__):
+            for name in klass.__dict__.get("__slots__", ()):
+                if name not in fields and name != "__dict__":
+                    fields.append(name)
+        cls._fields = tuple(fields)
+        cls._from_json = staticmethod(_make_loader(cls))
+
     def __init__(self, *args: list, **kwargs: dict):
         """Initialize a Base instance"""
-        s_class = str(self.__class__.__name__)
-        if DATA.get(s_class) is None:
-            DATA[s_class] = {}
-
         self.id = kwargs.get("id", str(uuid.uuid4()))
+        now = datetime.utcnow()
         if kwargs.get("created_at") is not None:
-            self.created_at = datetime.strptime(
-                kwargs.get("created_at"), TIMESTAMP_FORMAT
-            )
+            self.created_at = _parse_timestamp(kwargs.get("created_at"))
         else:
-            self.created_at = datetime.utcnow()
+            self.created_at = now
         if kwargs.get("updated_at") is not None:
-            self.updated_at = datetime.strptime(
-                kwargs.get("updated_at"), TIMESTAMP_FORMAT
-            )
+            self.updated_at = _parse_timestamp(kwargs.get("updated_at"))
         else:
-            self.updated_at = datetime.utcnow()
+            self.updated_at = now
 
     def __eq__(self, other: TypeVar("Base")) -> bool:
         """Equality"""
@@ -45,11 +109,15 @@ class Base:
     def to_json(self, for_serialization: bool = False) -> dict:
         """Convert the object a JSON dictionary"""
         result = {}
-        for key, value in self.__dict__.items():
+        items = [(key, getattr(self, key)) for key in self._fields]
+        items.extend(getattr(self, "__dict__", {}).items())
+        for key, value in items:
             if not for_serialization and key[0] == "_":
                 continue
             if type(value) is datetime:
-                result[key] = value.strftime(TIMESTAMP_FORMAT)
+                result[key] = _format_timestamp(value)
+            elif type(value) is bytes:
+                result[key] = value.hex()
             else:
                 result[key] = value
         return result
@@ -57,48 +125,49 @@ class Base:
     @classmethod
     def load_from_file(cls):
         """Load all objects from file"""
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
-            return
-
-        with open(file_path, "r") as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+        storage.load(cls)
 
     @classmethod
     def save_to_file(cls):
         """Save all objects to file"""
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        storage.save_all(cls)
 
-        with open(file_path, "w") as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def flush(cls):
+        """Persist the pending changes of the model (write-behind mode)"""
+        storage.flush(cls)
 
     def save(self):
         """Save current object"""
-        s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        storage.save(self)
+
+    @classmethod
+    def save_many(cls, objs: Iterable[TypeVar("Base")]):
+        """Save several objects with one write of the storage
+
+        Unlike `save`, `updated_at` is kept as is.
+        """
+        storage.save_many(cls, objs)
 
     def remove(self):
         """Remove object"""
-        s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        storage.remove(self)
 
     @classmethod
-    def count(cls) -> int:
-        """Count all objects"""
-        s_class = cls.__name__
-        return len(DATA[s_class].keys())
+    def remove_many(cls, objs: Iterable[TypeVar("Base")]):
+        """Remove several objects with one write of the storage"""
+        storage.remove_many(cls, objs)
+
+    @classmethod
+    def count(cls, attributes: dict = None) -> int:
+        """Count all objects, or the ones with matching attributes"""
+        return storage.count(cls, attributes)
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Telemetry of the model kept by the storage"""
+        return storage.stats(cls)
 
     @classmethod
     def all(cls) -> Iterable[TypeVar("Base")]:
@@ -108,20 +177,57 @@ class Base:
     @classmethod
     def get(cls, id: str) -> TypeVar("Base"):
         """Return one object by ID"""
-        s_class = cls.__name__
-        return DATA[s_class].get(id)
+        return storage.get(cls, id)
+
+    @classmethod
+    def search(
+        cls,
+        attributes: dict = {},
+        limit: int = None,
+        offset: int = 0,
+        order_by: str = None,
+        after: str = None,
+    ) -> List[TypeVar("Base")]:
+        """Search all objects with matching attributes
+
+        Takes the same paging arguments as `iter_search`
+        """
+        return list(
+            cls.iter_search(attributes, limit, offset, order_by, after)
+        )
 
     @classmethod
-    def search(cls, attributes: dict = {}) -> List[TypeVar("Base")]:
-        """Search all objects with matching attributes"""
-        s_class = cls.__name__
-
-        def _search(obj):
-            if len(attributes) == 0:
-                return True
-            for k, v in attributes.items():
-                if getattr(obj, k) != v:
-                    return False
-            return True
-
-        return list(filter(_search, DATA[s_class].values()))
+    def iter_search(
+        cls,
+        attributes: dict = {},
+        limit: int = None,
+        offset: int = 0,
+        order_by: str = None,
+        after: str = None,
+    ) -> Iterator[TypeVar("Base")]:
+        """Lazily iterate over the objects with matching attributes
+
+        - limit: maximum number of objects returned
+        - offset: number of objects skipped
+        - order_by: attribute to sort by, `-attribute` for descending order
+        - after: ID of the last object of the previous page, to continue
+          from it instead of using an offset; only with `order_by` on an
+          attribute of `_indexes`, so that the page is found with the index
+          instead of a scan of the objects before it
+        """
+        if after is not None:
+            field = None if order_by is None else order_by.lstrip("-")
+            if field not in cls._indexes:
+                raise ValueError(
+                    "after needs order_by on one of: {}".format(
+                        ", ".join(cls._indexes)
+                    )
+                )
+        return storage.iter_search(
+            cls,
+            attributes,
+            limit=limit,
+            offset=offset,
+            order_by=order_by,
+            after=after,
+        )
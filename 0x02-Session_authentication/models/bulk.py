@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+""" Bulk import and export of users
+
+    $ python3 -m models.bulk import users.jsonl
+    $ python3 -m models.bulk export users.csv
+
+Rows are JSON objects (JSON Lines) or CSV records with the fields of
+User. A row carries either a plain `password`, hashed on import, or the
+hex SHA256 `_password` written by an export.
+
+Invalid rows, and rows whose email (or ID) is already taken by an earlier
+row of the file or, for the email, by another user, are skipped and
+reported with their line number.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator, List, TextIO, Tuple
+
+from models.base import TIMESTAMP_FORMAT
+from models.user import User
+
+FORMATS = ("jsonl", "csv")
+STRING_FIELDS = (
+    "id",
+    "email",
+    "password",
+    "_password",
+    "first_name",
+    "last_name",
+    "created_at",
+    "updated_at",
+)
+
+
+def _format_of(file_path: str, fmt: str = None) -> str:
+    """Format given, or guessed from the file extension"""
+    if fmt is None:
+        fmt = "csv" if file_path.endswith(".csv") else "jsonl"
+    if fmt not in FORMATS:
+        raise ValueError("Unknown format: {}".format(fmt))
+    return fmt
+
+
+def _read_rows(f: TextIO, fmt: str) -> Iterator[Tuple[int, object]]:
+    """Stream the rows of a file with their line numbers
+
+    CSV rows are dictionaries; JSON lines are left to `prepare` to parse.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, {
+                k: v for k, v in row.items() if k is not None and v != ""
+            }
+        return
+    for line_num, line in enumerate(f, 1):
+        if line.strip():
+            yield line_num, line
+
+
+def _batches(rows: Iterable[tuple], size: int) -> Iterator[List[tuple]]:
+    """Split rows into lists of `size` rows"""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _user_json(row: object, now: str) -> dict:
+    """JSON dictionary of the user of a row
+
+    Raises a ValueError telling what is wrong with the row.
+    """
+    if isinstance(row, str):
+        try:
+            row = json.loads(row)
+        except ValueError:
+            raise ValueError("invalid JSON")
+    if not isinstance(row, dict):
+        raise ValueError("not an object")
+    for field in STRING_FIELDS:
+        if row.get(field) is not None and type(row[field]) is not str:
+            raise ValueError("{} is not a string".format(field))
+    if not row.get("email"):
+        raise ValueError("no email")
+
+    password = row.get("password")
+    if password:
+        try:
+            digest = hashlib.sha256(password.encode("utf-8")).hexdigest()
+        except UnicodeEncodeError:
+            raise ValueError("password is not valid text")
+    else:
+        digest = row.get("_password")
+        if not digest:
+            raise ValueError("no password")
+        try:
+            if len(bytes.fromhex(digest)) != hashlib.sha256().digest_size:
+                raise ValueError
+        except ValueError:
+            raise ValueError("_password is not a hex SHA256")
+    for field in ("created_at", "updated_at"):
+        if row.get(field):
+            try:
+                datetime.strptime(row[field], TIMESTAMP_FORMAT)
+            except ValueError:
+                raise ValueError(
+                    "{} does not match {}".format(field, TIMESTAMP_FORMAT)
+                )
+    return {
+        "id": row.get("id") or str(uuid.uuid4()),
+        "email": row["email"],
+        "_password": digest,
+        "first_name": row.get("first_name"),
+        "last_name": row.get("last_name"),
+        "created_at": row.get("created_at") or now,
+        "updated_at": row.get("updated_at") or now,
+    }
+
+
+def prepare(
+    rows: List[Tuple[int, object]]
+) -> Tuple[List[Tuple[int, dict]], List[Tuple[int, str]]]:
+    """JSON dictionaries of the users of a batch of (line, row) pairs
+
+    Returns the (line, dictionary) pairs of the valid rows and the (line,
+    error) pairs of the others. This is the CPU bound part of an import
+    (parsing and password hashing), run in worker processes.
+    """
+    now = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+    users = []
+    errors = []
+    for line, row in rows:
+        try:
+            users.append((line, _user_json(row, now)))
+        except ValueError as e:
+            errors.append((line, str(e)))
+    return users, errors
+
+
+def _duplicate(obj_json: dict, emails: dict, ids: dict) -> str:
+    """Why a user cannot be imported after the earlier rows, or None
+
+    `emails` and `ids` map the emails and IDs of the users imported so far
+    to their line.
+    """
+    if obj_json["id"] in ids:
+        return "duplicate id, already on line {}".format(ids[obj_json["id"]])
+    email = obj_json["email"]
+    if email in emails:
+        return "duplicate email, already on line {}".format(emails[email])
+    for user in User.search({"email": email}):
+        if user.id != obj_json["id"]:
+            return "email already taken by user {}".format(user.id)
+    return None
+
+
+def _prepare_in(
+    executor: ProcessPoolExecutor,
+    batches: Iterable[List[Tuple[int, object]]],
+    ahead: int,
+) -> Iterator[Tuple[List[Tuple[int, dict]], List[Tuple[int, str]]]]:
+    """`prepare` batches in worker processes, results in order
+
+    At most `ahead` batches are read before their results are consumed, so
+    the file is not loaded in memory at once.
+    """
+    futures = deque()
+    for batch in batches:
+        futures.append(executor.submit(prepare, batch))
+        if len(futures) >= ahead:
+            yield futures.popleft().result()
+    while futures:
+        yield futures.popleft().result()
+
+
+def _progress(action: str, count: int, start: float, out: TextIO):
+    """Print the number of rows done and the rate"""
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed else 0
+    out.write("{} {} rows ({:.0f} rows/s)\n".format(action, count, rate))
+    out.flush()
+
+
+def import_users(
+    file_path: str,
+    fmt: str = None,
+    batch_size: int = 50000,
+    workers: int = None,
+    out: TextIO = sys.stderr,
+) -> int:
+    """Import the users of a file, saving them batch by batch
+
+    Existing users with the same ID are replaced. Rows skipped are
+    reported to `out` one by one. Returns the number of users imported.
+    """
+    fmt = _format_of(file_path, fmt)
+    workers = workers or os.cpu_count() or 1
+    User.load_from_file()
+    start = time.perf_counter()
+    count = 0
+    skipped = 0
+    emails = {}
+    ids = {}
+    with open(file_path, "r", newline="") as f:
+        batches = _batches(_read_rows(f, fmt), batch_size)
+        if workers > 1:
+            executor = ProcessPoolExecutor(workers)
+            prepared = _prepare_in(executor, batches, workers * 2)
+        else:
+            executor = None
+            prepared = map(prepare, batches)
+        try:
+            for users, errors in prepared:
+                objs = []
+                for line, obj_json in users:
+                    error = _duplicate(obj_json, emails, ids)
+                    if error is not None:
+                        errors.append((line, error))
+                        continue
+                    emails[obj_json["email"]] = line
+                    ids[obj_json["id"]] = line
+                    objs.append(User._from_json(obj_json))
+                for line, error in sorted(errors):
+                    out.write("line {}: {}, skipped\n".format(line, error))
+                User.save_many(objs)
+                count += len(objs)
+                skipped += len(errors)
+                _progress("imported", count, start, out)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+    User.flush()
+    _progress("imported", count, start, out)
+    if skipped:
+        out.write("skipped {} rows\n".format(skipped))
+    return count
+
+
+def export_users(
+    file_path: str,
+    fmt: str = None,
+    batch_size: int = 50000,
+    out: TextIO = sys.stderr,
+) -> int:
+    """Export every user to a file, returns the number of users"""
+    fmt = _format_of(file_path, fmt)
+    User.load_from_file()
+    start = time.perf_counter()
+    count = 0
+    with open(file_path, "w", newline="") as f:
+        if fmt == "csv":
+            writer = csv.DictWriter(f, fieldnames=User._fields)
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            def write(obj_json):
+                f.write(json.dumps(obj_json))
+                f.write("\n")
+
+        for user in User.iter_search():
+            write(user.to_json(True))
+            count += 1
+            if count % batch_size == 0:
+                _progress("exported", count, start, out)
+    _progress("exported", count, start, out)
+    return count
+
+
+def main(argv: List[str] = None) -> int:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(
+        prog="python3 -m models.bulk",
+        description="Import or export users as JSON Lines or CSV",
+    )
+    parser.add_argument("action", choices=("import", "export"))
+    parser.add_argument("file", help="path of the .jsonl or .csv file")
+    parser.add_argument(
+        "--format", choices=FORMATS, help="default: from the extension"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=50000,
+        help="users saved per write of the store (default: 50000)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="processes hashing passwords (default: one per CPU)",
+    )
+    args = parser.parse_args(argv)
+    if args.action == "import":
+        import_users(args.file, args.format, args.batch_size, args.workers)
+    else:
+        export_users(args.file, args.format, args.batch_size)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+""" Storage engines of the models
+"""
+from os import getenv
+
+
+def new_storage(data: dict):
+    """Create the storage engine selected by STORAGE_TYPE
+
+    - `file` (default): one `.db_<Class>.json` file per model. With
+      STORAGE_WRITE_BEHIND=1, files are written by a background thread
+      every STORAGE_FLUSH_INTERVAL seconds (default 1) or once
+      STORAGE_FLUSH_THRESHOLD changes are pending (default 100).
+      STORAGE_SHARDS=N splits each model into N files by hash of the IDs
+    - `sqlite`: one table per model in the STORAGE_PATH database
+    """
+    if getenv("STORAGE_TYPE") == "sqlite":
+        from models.engine.sqlite_storage import SQLiteStorage
+
+        return SQLiteStorage(data, getenv("STORAGE_PATH", ".db.sqlite3"))
+
+    from models.engine.file_storage import FileStorage
+
+    return FileStorage(
+        data,
+        write_behind=getenv("STORAGE_WRITE_BEHIND", "0").lower()
+        in ("1", "true", "yes"),
+        flush_interval=float(getenv("STORAGE_FLUSH_INTERVAL", "1")),
+        flush_threshold=int(getenv("STORAGE_FLUSH_THRESHOLD", "100")),
+        shards=int(getenv("STORAGE_SHARDS", "1")),
+    )
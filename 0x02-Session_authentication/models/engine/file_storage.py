@@ -0,0 +1,977 @@
+#!/usr/bin/env python3
+""" JSON file storage engine
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from itertools import chain, islice
+from typing import Iterable, Iterator, List, Tuple, TypeVar
+
+from models.engine.index import SortedIndex
+from models.engine.locks import RWLock
+from models.engine.query import matcher, order_field, paginate, predicates
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class FileStorage:
+    """Keep every object in memory and persist each model to JSON files
+
+    Each model is stored in `shards` files, an object going to the shard
+    given by a hash of its ID. With one shard (the default) this is the
+    `.db_<Class>.json` file; with N shards, `.db_<Class>.<i>.json` files,
+    and a change only rewrites the shard of the changed object.
+
+    Several processes (e.g. gunicorn workers) can share the same files:
+    - writers hold an advisory lock on `<file>.lock`, merge their changes
+      into the latest content of the file and replace it atomically
+    - readers compare the inode, size and mtime of each file with the ones
+      they loaded, and reload a shard only when another process wrote it
+
+    Saved and removed objects are applied to DATA right away and recorded
+    as pending until their model is flushed. By default `save`/`remove`
+    flush immediately; in write-behind mode a background thread flushes
+    every `flush_interval` seconds, or as soon as `flush_threshold` changes
+    are pending, and once more when the interpreter exits.
+
+    The attributes listed in `_indexes` of a model are kept in sorted
+    indexes, so equality, range and prefix searches on them only visit the
+    matching objects. Pages of other searches, and pages ordered by an
+    indexed attribute, read the objects (or the index) SCAN_CHUNK at a
+    time, only as far as the page goes.
+
+    DATA, the indexes and the pending changes are guarded by a reader/
+    writer lock: lookups by ID and counts need no lock, searches share the
+    read lock and changes take the write lock. Flushing only holds the lock
+    to copy the references of a shard, and serializes that snapshot
+    without blocking anyone.
+
+    Models with `_journaled` set append their changes to a journal next to
+    each file (`<file>.log`, one JSON `[id, object or null]` per line)
+    instead of rewriting it. The file is only rewritten, and the journal
+    removed, once the journal outgrows it (and JOURNAL_COMPACT_BYTES), so
+    a change costs O(1) amortized whatever the size of the model. Readers
+    whose file is unchanged only replay the lines appended since they last
+    read the journal.
+
+    Telemetry counters of each model (loads, writes, index use) are kept
+    up to date as the storage works, and returned by `stats`.
+    """
+
+    # Smallest journal rewritten into its file
+    JOURNAL_COMPACT_BYTES = 1 << 20
+    # Objects read at a time, under the read lock, by a lazy search
+    SCAN_CHUNK = 1000
+
+    def __init__(
+        self,
+        data: dict,
+        write_behind: bool = False,
+        flush_interval: float = 1.0,
+        flush_threshold: int = 100,
+        shards: int = 1,
+    ):
+        """Initialize the storage on top of the shared DATA dict"""
+        self.data = data
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.shards = max(1, shards)
+        self._signatures = {}
+        self._indexes = {}
+        self._versions = {}
+        self._members = {}
+        self._classes = {}
+        self._pending = {}
+        self._lock = RWLock()
+        self._flusher_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher = None
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        if write_behind:
+            atexit.register(self.flush)
+            if hasattr(os, "register_at_fork"):
+                os.register_at_fork(after_in_child=self._after_fork)
+
+    @staticmethod
+    def file_path(cls) -> str:
+        """Path of the JSON file of a model"""
+        return ".db_{}.json".format(cls.__name__)
+
+    def shard_path(self, cls, shard: int) -> str:
+        """Path of the JSON file of one shard of a model"""
+        if self.shards == 1:
+            return self.file_path(cls)
+        return ".db_{}.{}.json".format(cls.__name__, shard)
+
+    @staticmethod
+    def journal_path(file_path: str) -> str:
+        """Path of the journal of a JSON file"""
+        return "{}.log".format(file_path)
+
+    def shard_of(self, obj_id: str) -> int:
+        """Shard of an object, stable across processes and restarts"""
+        if self.shards == 1:
+            return 0
+        return zlib.crc32(obj_id.encode()) % self.shards
+
+    def _shard_ids(self, s_class: str, shard: int) -> Iterable[str]:
+        """IDs of the objects of one shard of a model"""
+        if self.shards == 1:
+            return self.data[s_class].keys()
+        return self._members[s_class][shard]
+
+    @staticmethod
+    def _signature(stat: os.stat_result) -> tuple:
+        """Identify one version of a file: a write always changes it"""
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _stat(self, file_path: str) -> tuple:
+        """Signature of a file, or None if it does not exist"""
+        try:
+            return self._signature(os.stat(file_path))
+        except FileNotFoundError:
+            return None
+
+    def _shard_signature(self, cls, shard: int) -> tuple:
+        """Signatures of the file of one shard and of its journal"""
+        file_path = self.shard_path(cls, shard)
+        if not cls._journaled:
+            return self._stat(file_path), None
+        return self._stat(file_path), self._stat(self.journal_path(file_path))
+
+    @staticmethod
+    def _journal_offset(known: tuple, current: tuple) -> int:
+        """Offset to replay the journal of a shard from, or None
+
+        Only a journal that grew in place (same file, same journal inode)
+        can be replayed from where it was last read.
+        """
+        if known is None or known[0] != current[0] or current[1] is None:
+            return None
+        if known[1] is None:
+            return 0
+        if known[1][0] != current[1][0] or current[1][1] < known[1][1]:
+            return None
+        return known[1][1]
+
+    def _locked(self, cls, shard: int):
+        """Hold the exclusive write lock of one shard of a model"""
+        return self._flocked("{}.lock".format(self.shard_path(cls, shard)))
+
+    @staticmethod
+    @contextmanager
+    def _flocked(lock_path: str):
+        """Hold the exclusive lock of a lock file"""
+        with open(lock_path, "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _refresh(self, cls, shard: int = None):
+        """Reload the shards of a model changed by another process"""
+        s_class = cls.__name__
+        if s_class not in self.data or s_class not in self._indexes:
+            self.load(cls)
+            return
+        shards = range(self.shards) if shard is None else (shard,)
+        for i in shards:
+            known = self._signatures.get((s_class, i))
+            current = self._shard_signature(cls, i)
+            if known == current:
+                continue
+            offset = self._journal_offset(known, current)
+            if offset is None:
+                self._reload_shard(cls, i)
+            else:
+                self._replay_shard(cls, i, offset)
+
+    def _record(self, s_class: str, **counters):
+        """Add to the telemetry counters of a model
+
+        Counters whose name starts with `last_` are replaced instead.
+        """
+        with self._stats_lock:
+            stats = self._stats.setdefault(s_class, {})
+            for name, value in counters.items():
+                if name.startswith("last_"):
+                    stats[name] = value
+                else:
+                    stats[name] = stats.get(name, 0) + value
+
+    def _reindex(self, cls):
+        """Rebuild the sorted indexes of a model"""
+        objs = self.data[cls.__name__].values()
+        self._indexes[cls.__name__] = {
+            field: SortedIndex((getattr(obj, field), obj.id) for obj in objs)
+            for field in cls._indexes
+        }
+
+    def _best_index(self, cls, attributes: dict) -> tuple:
+        """Most selective index for attributes: (index, lo, hi, size), or
+        None
+
+        An index only narrows predicates whose operands are of the type of
+        its values; others are left to the scan of the matches. The caller
+        holds the read lock.
+        """
+        indexes = self._indexes.get(cls.__name__, {})
+        best = None
+        for k, op, operand in predicates(attributes or {}):
+            index = indexes.get(k)
+            if index is None or (op == "eq" and operand is None):
+                continue
+            if not index.supports(op, operand):
+                continue
+            lo, hi = index.bounds(op, operand)
+            size = hi - lo + len(index.others)
+            if best is None or size < best[3]:
+                best = (index, lo, hi, size)
+        return best
+
+    def _candidates(self, cls, attributes: dict) -> Iterable:
+        """Objects that may match, narrowed with the most selective index,
+        or else all objects, scanned lazily"""
+        with self._lock.read():
+            objs = self.data[cls.__name__]
+            best = self._best_index(cls, attributes)
+            # Copying the references is cheap and lets callers save or
+            # remove objects while they iterate
+            if best is not None:
+                index, lo, hi, _ = best
+                candidates = [
+                    objs.get(obj_id) for obj_id in index.select(lo, hi)
+                ]
+                candidates.extend(objs.get(obj_id) for obj_id in index.others)
+        if attributes:
+            if best is None:
+                self._record(cls.__name__, index_misses=1)
+            else:
+                self._record(cls.__name__, index_hits=1)
+        if best is None:
+            return self._scan(cls)
+        return [obj for obj in candidates if obj is not None]
+
+    def _scan(self, cls) -> Iterator[TypeVar("Base")]:
+        """All objects of a model, read SCAN_CHUNK at a time
+
+        Objects may be saved or removed between two chunks: once the IDs of
+        the model changed, the scan goes on over the new ones, skipping the
+        objects already seen.
+        """
+        s_class = cls.__name__
+        objs = version = values = None
+        seen = set()
+        while True:
+            with self._lock.read():
+                current = self.data[s_class]
+                current_version = self._versions.get(s_class, 0)
+                if current is not objs or current_version != version:
+                    objs, version = current, current_version
+                    values = iter(objs.values())
+                chunk = list(islice(values, self.SCAN_CHUNK))
+            if not chunk:
+                return
+            for obj in chunk:
+                if obj.id not in seen:
+                    seen.add(obj.id)
+                    yield obj
+
+    def _walk(
+        self, cls, field: str, descending: bool, start: tuple
+    ) -> Iterator[TypeVar("Base")]:
+        """Objects in the order of the index of a field, after the (value,
+        id) pair `start` (or from the first one), read SCAN_CHUNK at a
+        time"""
+        s_class = cls.__name__
+        chunk_size = self.SCAN_CHUNK
+        while True:
+            with self._lock.read():
+                index = self._indexes.get(s_class, {}).get(field)
+                if index is None:
+                    return
+                objs = self.data[s_class]
+                try:
+                    if descending:
+                        hi = len(index.ids)
+                        if start is not None:
+                            hi = index.before(*start)
+                        lo = max(0, hi - chunk_size)
+                    else:
+                        lo = 0 if start is None else index.after(*start)
+                        hi = lo + chunk_size
+                except TypeError:
+                    # The index was rebuilt for values of another type
+                    return
+                pairs = list(zip(index.values[lo:hi], index.ids[lo:hi]))
+                chunk = [objs.get(obj_id) for _, obj_id in pairs]
+            if descending:
+                pairs.reverse()
+                chunk.reverse()
+            if not pairs:
+                return
+            for obj in chunk:
+                if obj is not None:
+                    yield obj
+            start = pairs[-1]
+
+    def _ordered(
+        self, cls, attributes: dict, order_by: str, after: str, pages: int
+    ) -> Iterator[TypeVar("Base")]:
+        """Objects that may match in the order of `order_by`, walking the
+        index of its attribute, or None if sorting the candidates is better
+
+        The index must hold every object of the model, all of one type,
+        for its order to be the order of `sort_key`. Walking it visits
+        about pages * objects / candidates objects to find `pages` matches,
+        sorting the candidates visits them all.
+        """
+        field, descending = order_field(cls, order_by)
+        with self._lock.read():
+            objs = self.data[cls.__name__]
+            index = self._indexes.get(cls.__name__, {}).get(field)
+            if (
+                index is None
+                or index.others
+                or len(index.ids) != len(objs.keys())
+            ):
+                return None
+            best = self._best_index(cls, attributes)
+            size = len(objs.keys()) if best is None else best[3]
+            if pages is None:
+                pages = len(objs.keys())
+            if pages * len(objs.keys()) > size * size:
+                return None
+            start = None
+            if after is not None:
+                cursor = objs.get(after)
+                if cursor is None:
+                    return iter(())
+                start = (getattr(cursor, field), cursor.id)
+                if type(start[0]) is not index.kind:
+                    return None
+        return self._walk(cls, field, descending, start)
+
+    def _apply(self, cls, obj_id: str, obj: TypeVar("Base")):
+        """Apply a saved object (or a removal, obj is None) to DATA
+
+        The indexes are updated first, and restored if that fails, so DATA
+        never holds an object they do not.
+
+        The caller holds the write lock.
+        """
+        s_class = cls.__name__
+        objs = self.data[s_class]
+        indexes = self._indexes[s_class]
+        members = None
+        if self.shards > 1:
+            members = self._members[s_class][self.shard_of(obj_id)]
+        # The indexes do not keep values: the object they hold gives them
+        old = objs.get(obj_id)
+        try:
+            for field, index in indexes.items():
+                if old is None:
+                    if obj is not None:
+                        index.add(obj_id, getattr(obj, field))
+                elif obj is None:
+                    index.discard(obj_id, getattr(old, field))
+                else:
+                    index.replace(
+                        obj_id, getattr(old, field), getattr(obj, field)
+                    )
+        except Exception:
+            for field, index in indexes.items():
+                # Not found at its value, the object is looked for by ID
+                index.discard(obj_id, None)
+                if old is not None:
+                    index.add(obj_id, getattr(old, field))
+            raise
+        if (obj is None) == (obj_id in objs):
+            # The IDs change: restart the scans in progress
+            self._versions[s_class] = self._versions.get(s_class, 0) + 1
+        if obj is None:
+            objs.pop(obj_id, None)
+            if members is not None:
+                members.discard(obj_id)
+        else:
+            objs[obj_id] = obj
+            if members is not None:
+                members.add(obj_id)
+
+    def _apply_many(
+        self, cls, objs: List[TypeVar("Base")], removed: List[str] = ()
+    ):
+        """Apply many saved objects and removed IDs to DATA, updating
+        indexes in bulk
+
+        The caller holds the write lock.
+        """
+        s_class = cls.__name__
+        data = self.data[s_class]
+        self._versions[s_class] = self._versions.get(s_class, 0) + 1
+        # Objects replaced or removed, to find them in the indexes
+        olds = {
+            obj_id: data[obj_id]
+            for obj_id in chain(removed, (obj.id for obj in objs))
+            if obj_id in data
+        }
+        for obj_id in removed:
+            data.pop(obj_id, None)
+        data.update((obj.id, obj) for obj in objs)
+        if self.shards > 1:
+            members = self._members[s_class]
+            for obj_id in removed:
+                members[self.shard_of(obj_id)].discard(obj_id)
+            for obj in objs:
+                members[self.shard_of(obj.id)].add(obj.id)
+        for field, index in self._indexes[s_class].items():
+            if olds:
+                index.discard_many(
+                    (obj_id, getattr(old, field))
+                    for obj_id, old in olds.items()
+                )
+            index.update((obj.id, getattr(obj, field)) for obj in objs)
+
+    def _change(self, cls, changes: dict):
+        """Record changes of a model and persist them
+
+        `changes` maps IDs to saved objects, or to None for removals.
+        """
+        s_class = cls.__name__
+        if len(changes) == 1:
+            self._refresh(cls, self.shard_of(next(iter(changes))))
+        else:
+            self._refresh(cls)
+        with self._lock.write():
+            self._classes[s_class] = cls
+            if len(changes) == 1:
+                self._apply(cls, *next(iter(changes.items())))
+            else:
+                self._apply_many(
+                    cls,
+                    [obj for obj in changes.values() if obj is not None],
+                    [obj_id for obj_id, obj in changes.items() if obj is None],
+                )
+            self._pending.setdefault(s_class, {}).update(changes)
+            pending = sum(len(objs) for objs in self._pending.values())
+
+        if not self.write_behind:
+            self.flush(cls)
+            return
+        self._start_flusher()
+        if pending >= self.flush_threshold:
+            self._wakeup.set()
+
+    def _read(self, cls, shard: int) -> Tuple[tuple, List[TypeVar("Base")]]:
+        """Signatures and objects of the file of one shard and its journal"""
+        file_path = self.shard_path(cls, shard)
+        try:
+            f = open(file_path, "r")
+        except FileNotFoundError:
+            signature, objs_json = None, {}
+        else:
+            with f:
+                signature = self._signature(os.fstat(f.fileno()))
+                objs_json = json.load(f)
+
+        journal_signature = None
+        if cls._journaled:
+            journal_signature, entries = self._read_journal(
+                self.journal_path(file_path)
+            )
+            self._replay(objs_json, entries)
+        from_json = cls._from_json
+        return (signature, journal_signature), [
+            from_json(obj) for obj in objs_json.values()
+        ]
+
+    @staticmethod
+    def _read_journal(
+        journal_path: str, offset: int = 0
+    ) -> Tuple[tuple, List[Tuple[str, dict]]]:
+        """Signature and entries of a journal, from `offset`
+
+        The signature records the offset of the end of the last complete
+        line instead of the size: a line still being appended is read
+        again once complete.
+        """
+        try:
+            f = open(journal_path, "rb")
+        except FileNotFoundError:
+            return None, []
+
+        with f:
+            stat = os.fstat(f.fileno())
+            f.seek(offset)
+            data = f.read(stat.st_size - offset)
+        end = data.rfind(b"\n") + 1
+        entries = []
+        for line in data[:end].splitlines():
+            try:
+                entries.append(tuple(json.loads(line)))
+            except ValueError:
+                # Cut by a crash during an append, before newer lines
+                continue
+        return (stat.st_ino, offset + end, stat.st_mtime_ns), entries
+
+    @staticmethod
+    def _replay(objs_json: dict, entries: List[Tuple[str, dict]]):
+        """Apply the entries of a journal to the JSON dictionary of a file"""
+        for obj_id, obj_json in entries:
+            if obj_json is None:
+                objs_json.pop(obj_id, None)
+            else:
+                objs_json[obj_id] = obj_json
+
+    def _append(self, cls, shard: int, changes: dict):
+        """Append changes to the journal of one shard of a model
+
+        `changes` maps IDs to JSON dictionaries, or to None for removals.
+        The caller holds the lock of the shard.
+        """
+        s_class = cls.__name__
+        journal_path = self.journal_path(self.shard_path(cls, shard))
+        start = time.perf_counter()
+        data = "".join(
+            json.dumps([obj_id, obj_json]) + "\n"
+            for obj_id, obj_json in changes.items()
+        ).encode("utf-8")
+        with open(journal_path, "a+b") as f:
+            size = f.seek(0, os.SEEK_END)
+            if size:
+                f.seek(size - 1)
+                if f.read(1) != b"\n":
+                    # Terminate a line cut by a crash
+                    data = b"\n" + data
+            f.write(data)
+            f.flush()
+            stat = os.fstat(f.fileno())
+        key = (s_class, shard)
+        self._signatures[key] = (
+            self._signatures[key][0],
+            self._signature(stat),
+        )
+        self._record(
+            s_class,
+            writes=1,
+            bytes_written=len(data),
+            last_write_ms=(time.perf_counter() - start) * 1000,
+            last_write_bytes=len(data),
+        )
+
+    def _compaction_due(self, signature: tuple) -> bool:
+        """Whether the journal of a shard is due to be rewritten into it"""
+        file_signature, journal_signature = signature or (None, None)
+        if journal_signature is None:
+            return False
+        file_size = file_signature[1] if file_signature else 0
+        return journal_signature[1] > max(
+            file_size, self.JOURNAL_COMPACT_BYTES
+        )
+
+    def _write(self, cls, shard: int, objs_json: dict):
+        """Atomically replace the file of one shard of a model"""
+        file_path = self.shard_path(cls, shard)
+        tmp_path = "{}.{}.tmp".format(file_path, os.getpid())
+        start = time.perf_counter()
+        with open(tmp_path, "w") as f:
+            # dumps() runs the C encoder in one shot; dump() would go
+            # through the pure Python one chunk by chunk
+            f.write(json.dumps(objs_json))
+        os.replace(tmp_path, file_path)
+        stat = os.stat(file_path)
+        if cls._journaled:
+            # The file now holds every change of the journal
+            try:
+                os.remove(self.journal_path(file_path))
+            except FileNotFoundError:
+                pass
+        self._signatures[(cls.__name__, shard)] = (
+            self._signature(stat),
+            None,
+        )
+        self._record(
+            cls.__name__,
+            writes=1,
+            bytes_written=stat.st_size,
+            last_write_ms=(time.perf_counter() - start) * 1000,
+            last_write_bytes=stat.st_size,
+        )
+
+    def _snapshot(self, cls, shard: int) -> List[TypeVar("Base")]:
+        """Objects of one shard of a model, to serialize without the lock
+
+        The caller holds the lock.
+        """
+        objs = self.data[cls.__name__]
+        shard_ids = self._shard_ids(cls.__name__, shard)
+        return [objs[obj_id] for obj_id in shard_ids]
+
+    @staticmethod
+    def _serialize(snapshot: List[TypeVar("Base")]) -> dict:
+        """JSON dictionary of a snapshot of objects"""
+        objs_json = {}
+        for obj in snapshot:
+            objs_json[obj.id] = obj.to_json(True)
+        return objs_json
+
+    def _start_flusher(self):
+        """Start the write-behind thread if it is not running"""
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._flusher_lock:
+            if self._flusher is not None and self._flusher.is_alive():
+                return
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name="FileStorage-flush", daemon=True
+            )
+            self._flusher.start()
+
+    def _flush_loop(self):
+        """Flush pending changes until the process exits"""
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing pending changes failed")
+
+    def _after_fork(self):
+        """Forget the flush thread and locks inherited from the parent"""
+        self._lock = RWLock()
+        self._flusher_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flusher = None
+
+    def flush(self, cls=None):
+        """Persist the pending changes of one model, or of all of them"""
+        if cls is None:
+            for klass in list(self._classes.values()):
+                self.flush(klass)
+            return
+
+        pending = self._pending.get(cls.__name__)
+        if not pending:
+            return
+        shards = {self.shard_of(obj_id) for obj_id in list(pending)}
+        for shard in sorted(shards):
+            self._flush_shard(cls, shard)
+
+    def _flush_shard(self, cls, shard: int):
+        """Persist the pending changes of one shard of a model"""
+        s_class = cls.__name__
+        with self._locked(cls, shard):
+            # Merge with what other processes wrote before taking the
+            # pending changes: reloading re-applies them to DATA
+            self._refresh(cls, shard)
+            with self._lock.write():
+                pending = self._pending.get(s_class, {})
+                taken = {
+                    obj_id: obj
+                    for obj_id, obj in pending.items()
+                    if self.shard_of(obj_id) == shard
+                }
+                if not taken:
+                    return
+                for obj_id in taken:
+                    del pending[obj_id]
+                signature = self._signatures.get((s_class, shard))
+                # A batch changing a large part of the shard is smaller
+                # written as a new file than appended
+                journal = cls._journaled and (
+                    signature is not None
+                    and not self._compaction_due(signature)
+                    and len(taken) * 8 <= len(self._shard_ids(s_class, shard))
+                )
+                if not journal:
+                    snapshot = self._snapshot(cls, shard)
+            try:
+                if journal:
+                    self._append(
+                        cls,
+                        shard,
+                        {
+                            obj_id: None if obj is None else obj.to_json(True)
+                            for obj_id, obj in taken.items()
+                        },
+                    )
+                else:
+                    self._write(cls, shard, self._serialize(snapshot))
+            except Exception:
+                with self._lock.write():
+                    taken.update(self._pending.get(s_class, {}))
+                    self._pending[s_class] = taken
+                raise
+
+    def _reload_shard(self, cls, shard: int):
+        """Replace the objects of one shard with the content of its file"""
+        s_class = cls.__name__
+        signature, loaded = self._read(cls, shard)
+        with self._lock.write():
+            old_ids = set(self._shard_ids(s_class, shard))
+            new_ids = {obj.id for obj in loaded}
+            # Rebuilding the indexes beats updating them one by one once a
+            # large part of the model changed
+            rebuild = len(loaded) > len(self.data[s_class]) // 8
+            if rebuild:
+                self._indexes[s_class] = {}
+            for obj_id in old_ids - new_ids:
+                self._apply(cls, obj_id, None)
+            for obj in loaded:
+                self._apply(cls, obj.id, obj)
+            for obj_id, obj in self._pending.get(s_class, {}).items():
+                if self.shard_of(obj_id) == shard:
+                    self._apply(cls, obj_id, obj)
+            if rebuild:
+                self._reindex(cls)
+            self._signatures[(s_class, shard)] = signature
+
+    def _replay_shard(self, cls, shard: int, offset: int):
+        """Apply the lines appended to the journal of one shard since
+        `offset`, the file itself being unchanged"""
+        s_class = cls.__name__
+        file_path = self.shard_path(cls, shard)
+        journal_signature, entries = self._read_journal(
+            self.journal_path(file_path), offset
+        )
+        from_json = cls._from_json
+        changes = [
+            (obj_id, None if obj_json is None else from_json(obj_json))
+            for obj_id, obj_json in entries
+        ]
+        with self._lock.write():
+            # Pending changes are newer than anything written
+            pending = self._pending.get(s_class, {})
+            for obj_id, obj in changes:
+                if obj_id not in pending:
+                    self._apply(cls, obj_id, obj)
+            signature = self._signatures[(s_class, shard)]
+            self._signatures[(s_class, shard)] = (
+                signature[0],
+                journal_signature,
+            )
+
+    def load(self, cls):
+        """Load all objects of a model from its files
+
+        Shards are read one after the other: parsing JSON holds the GIL, so
+        threads would not read them any faster. Changes that are still
+        pending are applied on top of the files.
+        """
+        s_class = cls.__name__
+        start = time.perf_counter()
+        if self.shards == 1:
+            results = [self._read(cls, 0)]
+        else:
+            self._migrate(cls)
+            results = [self._read(cls, shard) for shard in range(self.shards)]
+
+        with self._lock.write():
+            objs = {}
+            members = [set() for _ in range(self.shards)]
+            for shard, (signature, loaded) in enumerate(results):
+                for obj in loaded:
+                    objs[obj.id] = obj
+                if self.shards > 1:
+                    members[shard].update(obj.id for obj in loaded)
+                self._signatures[(s_class, shard)] = signature
+            self.data[s_class] = objs
+            self._members[s_class] = members
+            self._indexes[s_class] = {}
+
+            for obj_id, obj in self._pending.get(s_class, {}).items():
+                self._apply(cls, obj_id, obj)
+            self._reindex(cls)
+        self._record(
+            s_class, loads=1, last_load_ms=(time.perf_counter() - start) * 1000
+        )
+
+    def _migrate(self, cls):
+        """Write the unsharded file of a model (and its journal) to the
+        shards, unless a shard file exists already
+
+        Once written, the shards are the only truth: objects they lost
+        since are not imported again. Processes migrating at once are
+        serialized by the lock of the unsharded file.
+        """
+
+        def unsharded() -> bool:
+            return all(
+                self._shard_signature(cls, shard) == (None, None)
+                for shard in range(self.shards)
+            )
+
+        file_path = self.file_path(cls)
+        journal_path = self.journal_path(file_path)
+        if not unsharded() or not (
+            os.path.exists(file_path) or os.path.exists(journal_path)
+        ):
+            return
+        with self._flocked("{}.lock".format(file_path)):
+            if not unsharded():
+                return
+            try:
+                with open(file_path, "r") as f:
+                    objs_json = json.load(f)
+            except FileNotFoundError:
+                objs_json = {}
+            if cls._journaled:
+                _, entries = self._read_journal(journal_path)
+                self._replay(objs_json, entries)
+            shards = {}
+            for obj_id, obj_json in objs_json.items():
+                shards.setdefault(self.shard_of(obj_id), {})[obj_id] = obj_json
+            for shard, shard_json in shards.items():
+                self._write(cls, shard, shard_json)
+
+    def save_all(self, cls):
+        """Save all objects of a model, replacing the content of its files"""
+        s_class = cls.__name__
+        with self._lock.write():
+            objs = self.data.setdefault(s_class, {})
+            self._pending.pop(s_class, None)
+            members = [set() for _ in range(self.shards)]
+            if self.shards > 1:
+                for obj_id in objs:
+                    members[self.shard_of(obj_id)].add(obj_id)
+            self._members[s_class] = members
+            self._reindex(cls)
+        for shard in range(self.shards):
+            with self._locked(cls, shard):
+                with self._lock.read():
+                    snapshot = self._snapshot(cls, shard)
+                self._write(cls, shard, self._serialize(snapshot))
+
+    def save(self, obj: TypeVar("Base")):
+        """Save one object"""
+        self._change(obj.__class__, {obj.id: obj})
+
+    def save_many(self, cls, objs: Iterable[TypeVar("Base")]):
+        """Save many objects of a model with one write of each shard"""
+        changes = {obj.id: obj for obj in objs}
+        if changes:
+            self._change(cls, changes)
+
+    def remove(self, obj: TypeVar("Base")):
+        """Remove one object"""
+        cls = obj.__class__
+        self._refresh(cls, self.shard_of(obj.id))
+        if self.data[cls.__name__].get(obj.id) is not None:
+            self._change(cls, {obj.id: None})
+
+    def remove_many(self, cls, objs: Iterable[TypeVar("Base")]):
+        """Remove many objects of a model with one write of each shard"""
+        self._refresh(cls)
+        existing = self.data[cls.__name__]
+        changes = {obj.id: None for obj in objs if obj.id in existing}
+        if changes:
+            self._change(cls, changes)
+
+    def stats(self, cls) -> dict:
+        """Telemetry of a model, from the counters kept by the storage
+
+        - objects: number of objects in memory
+        - pending: changes not written yet
+        - file_bytes: size of the files and journals, as last read or
+          written
+        - loads, last_load_ms: full loads of the model and the last one's
+          duration
+        - writes, bytes_written, last_write_ms, last_write_bytes: file
+          writes, total and last ones
+        - index_hits, index_misses: searches narrowed with an index, or
+          scanning every object
+        """
+        s_class = cls.__name__
+        self._refresh(cls)
+        signatures = [
+            self._signatures.get((s_class, shard))
+            for shard in range(self.shards)
+        ]
+        result = {
+            "objects": len(self.data[s_class].keys()),
+            "pending": len(self._pending.get(s_class, {}).keys()),
+            "shards": self.shards,
+            "file_bytes": sum(
+                part[1]
+                for signature in signatures
+                if signature
+                for part in signature
+                if part
+            ),
+            "loads": 0,
+            "last_load_ms": None,
+            "writes": 0,
+            "bytes_written": 0,
+            "last_write_ms": None,
+            "last_write_bytes": None,
+            "index_hits": 0,
+            "index_misses": 0,
+        }
+        with self._stats_lock:
+            result.update(self._stats.get(s_class, {}))
+        return result
+
+    def count(self, cls, attributes: dict = None) -> int:
+        """Count all objects of a model, or the ones matching attributes"""
+        self._refresh(cls)
+        if not attributes:
+            return len(self.data[cls.__name__].keys())
+        candidates = self._candidates(cls, attributes)
+        return sum(1 for _ in filter(matcher(attributes), candidates))
+
+    def get(self, cls, id: str) -> TypeVar("Base"):
+        """Return one object by ID"""
+        if type(id) is str:
+            self._refresh(cls, self.shard_of(id))
+        else:
+            self._refresh(cls)
+        return self.data[cls.__name__].get(id)
+
+    def iter_search(
+        self,
+        cls,
+        attributes: dict,
+        limit: int = None,
+        offset: int = 0,
+        order_by: str = None,
+        after: str = None,
+    ) -> Iterator[TypeVar("Base")]:
+        """Lazily iterate over the objects with matching attributes"""
+        self._refresh(cls)
+        stop = None if limit is None else offset + limit
+        if order_by is not None:
+            matches = self._ordered(cls, attributes, order_by, after, stop)
+            if matches is not None:
+                if attributes:
+                    matches = filter(matcher(attributes), matches)
+                yield from islice(matches, offset, stop)
+                return
+        matches = self._candidates(cls, attributes)
+        if attributes:
+            matches = filter(matcher(attributes), matches)
+        yield from paginate(
+            cls,
+            matches,
+            self.data[cls.__name__],
+            limit=limit,
+            offset=offset,
+            order_by=order_by,
+            after=after,
+        )
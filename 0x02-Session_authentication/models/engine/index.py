@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+""" Sorted in-memory index on one attribute of a model
+"""
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from typing import Iterable, List, Tuple
+
+
+class _Unordered:
+    """Kind of an index whose values have no order: nothing is sorted"""
+
+
+def _kind(value) -> type:
+    """Kind of an index of values like `value`"""
+    try:
+        value < value
+    except TypeError:
+        return _Unordered
+    return type(value)
+
+
+def prefix_successor(prefix: str) -> str:
+    """Smallest string greater than every string starting with `prefix`"""
+    while prefix and prefix[-1] == chr(0x10FFFF):
+        prefix = prefix[:-1]
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class SortedIndex:
+    """IDs of the objects sorted by (value, id) of one attribute
+
+    Values and IDs are kept in two parallel lists so any range of values is
+    found with a binary search. Objects without value (None) are not
+    indexed.
+
+    Only values of one type, the `kind` of the index (the most common one
+    when it is built), are sorted. Values of other types, which may not
+    compare with them (an int among strings), are kept apart in `others`:
+    a search through the index must check them too.
+    """
+
+    def __init__(self, pairs: Iterable[Tuple[object, str]] = ()):
+        """Build the index from (value, id) pairs"""
+        pairs = [pair for pair in pairs if pair[0] is not None]
+        kinds = Counter(type(value) for value, _ in pairs)
+        self.kind = None
+        if kinds:
+            kind = kinds.most_common(1)[0][0]
+            self.kind = _kind(next(v for v, _ in pairs if type(v) is kind))
+        self.others = {}
+        sortable = []
+        for value, obj_id in pairs:
+            if type(value) is self.kind:
+                sortable.append((value, obj_id))
+            else:
+                self.others[obj_id] = value
+        try:
+            sortable.sort()
+        except TypeError:
+            self.others.update((obj_id, value) for value, obj_id in sortable)
+            self.kind = _Unordered
+            sortable = []
+        self.values = [value for value, _ in sortable]
+        self.ids = [obj_id for _, obj_id in sortable]
+
+    def __len__(self) -> int:
+        """Number of indexed objects"""
+        return len(self.ids) + len(self.others)
+
+    def supports(self, op: str, operand) -> bool:
+        """Whether `op operand` is searched with a binary search: the
+        operands must be of the kind of the index"""
+        if self.kind is None:
+            return True
+        operands = operand if op == "between" else (operand,)
+        return all(type(value) is self.kind for value in operands)
+
+    def _position(self, value, obj_id: str) -> int:
+        """Position of (value, id) in the sorted lists"""
+        lo = bisect_left(self.values, value)
+        hi = bisect_right(self.values, value, lo)
+        return bisect_left(self.ids, obj_id, lo, hi)
+
+    def _at(self, obj_id: str, value) -> int:
+        """Position of an object indexed with `value`, or None"""
+        if type(value) is not self.kind:
+            return None
+        try:
+            i = self._position(value, obj_id)
+        except TypeError:
+            return None
+        if i < len(self.ids) and self.ids[i] == obj_id:
+            if self.values[i] == value:
+                return i
+        return None
+
+    def _find(self, obj_id: str, value) -> int:
+        """Position of an object in the sorted lists, or None
+
+        The index does not keep the value of each object: it is looked for
+        at the value its object holds, else (the object was changed in
+        place since it was indexed) by ID, in linear time.
+        """
+        i = self._at(obj_id, value)
+        if i is not None:
+            return i
+        try:
+            return self.ids.index(obj_id)
+        except ValueError:
+            return None
+
+    def discard(self, obj_id: str, value):
+        """Remove an object, holding `value`, from the index"""
+        if self.others.pop(obj_id, None) is not None:
+            return
+        i = self._find(obj_id, value)
+        if i is not None:
+            del self.values[i]
+            del self.ids[i]
+
+    def add(self, obj_id: str, value):
+        """Index an object that is not indexed"""
+        if value is None:
+            return
+        if self.kind is None:
+            self.kind = _kind(value)
+        if type(value) is self.kind:
+            try:
+                i = self._position(value, obj_id)
+            except TypeError:
+                # The kind has no order after all
+                pass
+            else:
+                self.values.insert(i, value)
+                self.ids.insert(i, obj_id)
+                return
+        self.others[obj_id] = value
+        if self.kind is not _Unordered and len(self.others) > len(self.ids):
+            # The kind is no longer the most common type
+            self.__init__(
+                list(zip(self.values, self.ids))
+                + [(value, obj_id) for obj_id, value in self.others.items()]
+            )
+
+    def replace(self, obj_id: str, old, value):
+        """Re-index an object that held `old` and now holds `value`"""
+        if old is not None and type(old) is type(value) and old == value:
+            # Unchanged, unless the object was changed in place
+            if self.others.get(obj_id) == value:
+                return
+            if self._at(obj_id, value) is not None:
+                return
+        self.discard(obj_id, old)
+        self.add(obj_id, value)
+
+    def update(self, items: Iterable[Tuple[str, object]]):
+        """Index many (id, value) pairs of objects that are not indexed
+
+        A few items are inserted one by one; many are sorted and merged
+        with the index in linear time.
+        """
+        items = list(dict(items).items())
+        if len(items) * 8 < len(self.ids):
+            for obj_id, value in items:
+                self.add(obj_id, value)
+            return
+
+        pairs = list(zip(self.values, self.ids))
+        others = [(value, obj_id) for obj_id, value in self.others.items()]
+        others.extend(
+            (value, obj_id) for obj_id, value in items if value is not None
+        )
+        if self.kind is None or len(others) > len(pairs):
+            # Also picks the kind of the index
+            self.__init__(pairs + others)
+            return
+        new_pairs = [pair for pair in others if type(pair[0]) is self.kind]
+        try:
+            # Two sorted runs: the sort only merges them
+            new_pairs.sort()
+            new_pairs = sorted(pairs + new_pairs)
+        except TypeError:
+            # The kind has no order after all
+            self.__init__(pairs + others)
+            return
+        self.others = {
+            obj_id: value
+            for value, obj_id in others
+            if type(value) is not self.kind
+        }
+        self.values = [value for value, _ in new_pairs]
+        self.ids = [obj_id for _, obj_id in new_pairs]
+
+    def discard_many(self, items: Iterable[Tuple[str, object]]):
+        """Remove many objects, given as (id, value held) pairs, at once
+
+        A few objects are removed one by one; many are filtered out in
+        linear time.
+        """
+        items = [
+            (obj_id, value)
+            for obj_id, value in items
+            if self.others.pop(obj_id, None) is None
+        ]
+        if len(items) * 8 < len(self.ids):
+            for obj_id, value in items:
+                self.discard(obj_id, value)
+            return
+
+        obj_ids = {obj_id for obj_id, _ in items}
+        pairs = [
+            pair
+            for pair in zip(self.values, self.ids)
+            if pair[1] not in obj_ids
+        ]
+        self.values = [value for value, _ in pairs]
+        self.ids = [obj_id for _, obj_id in pairs]
+
+    def bounds(self, op: str, operand) -> Tuple[int, int]:
+        """Range of positions whose values satisfy `op operand`, an operand
+        the index `supports`; the `others` may satisfy it too"""
+        values = self.values
+        if op == "eq":
+            lo = bisect_left(values, operand)
+            return lo, bisect_right(values, operand, lo)
+        if op == "gt":
+            return bisect_right(values, operand), len(values)
+        if op == "gte":
+            return bisect_left(values, operand), len(values)
+        if op == "lt":
+            return 0, bisect_left(values, operand)
+        if op == "lte":
+            return 0, bisect_right(values, operand)
+        if op == "between":
+            low, high = operand
+            lo = bisect_left(values, low)
+            return lo, max(lo, bisect_right(values, high))
+        if op == "startswith":
+            lo = bisect_left(values, operand)
+            successor = prefix_successor(operand)
+            if successor is None:
+                return lo, len(values)
+            return lo, bisect_left(values, successor, lo)
+        raise ValueError("Unknown operator: {}".format(op))
+
+    def after(self, value, obj_id: str) -> int:
+        """Position of the first pair ordered after (value, id)"""
+        i = self._position(value, obj_id)
+        if i < len(self.ids) and self.ids[i] == obj_id:
+            if self.values[i] == value:
+                i += 1
+        return i
+
+    def before(self, value, obj_id: str) -> int:
+        """Position after the last pair ordered before (value, id)"""
+        return self._position(value, obj_id)
+
+    def select(self, lo: int, hi: int) -> List[str]:
+        """IDs between two positions, in value order"""
+        return self.ids[lo:hi]
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+""" Reader/writer lock of the storage engines
+"""
+import threading
+from contextlib import contextmanager
+
+
+class RWLock:
+    """Shared lock for readers, exclusive lock for writers
+
+    Writers are preferred: once a writer waits, new readers wait too, so a
+    steady flow of reads cannot starve writes. Both locks are reentrant,
+    and the thread holding the write lock may take the read lock. Taking
+    the write lock while holding the read lock is not supported.
+    """
+
+    def __init__(self):
+        """Initialize an unlocked lock"""
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._depth = 0
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    @contextmanager
+    def read(self):
+        """Hold the lock shared with other readers"""
+        me = threading.get_ident()
+        held = getattr(self._local, "reads", 0)
+        if held or self._writer == me:
+            self._local.reads = held + 1
+            try:
+                yield
+            finally:
+                self._local.reads = held
+            return
+
+        with self._cond:
+            while self._writer is not None or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        self._local.reads = 1
+        try:
+            yield
+        finally:
+            self._local.reads = 0
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        """Hold the lock exclusively"""
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._depth += 1
+            else:
+                self._waiting_writers += 1
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+                self._waiting_writers -= 1
+                self._writer = me
+                self._depth = 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._depth -= 1
+                if not self._depth:
+                    self._writer = None
+                    self._cond.notify_all()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+""" Query helpers shared by the storage engines
+"""
+import heapq
+from itertools import dropwhile, islice
+from typing import Callable, Iterable, Iterator, List, Tuple, TypeVar
+
+
+def _ordered(compare: Callable[[object, object], bool]) -> Callable:
+    """Comparison that is false, instead of raising, for a missing value or
+    a value that cannot be ordered with the operand (an int and a str)"""
+
+    def _test(value, operand) -> bool:
+        if value is None:
+            return False
+        try:
+            return compare(value, operand)
+        except TypeError:
+            return False
+
+    return _test
+
+
+OPERATORS = {
+    "eq": lambda value, operand: value == operand,
+    "gt": _ordered(lambda value, operand: value > operand),
+    "gte": _ordered(lambda value, operand: value >= operand),
+    "lt": _ordered(lambda value, operand: value < operand),
+    "lte": _ordered(lambda value, operand: value <= operand),
+    "between": _ordered(
+        lambda value, operand: operand[0] <= value <= operand[1]
+    ),
+    "startswith": lambda value, operand: (
+        isinstance(value, str)
+        and isinstance(operand, str)
+        and value.startswith(operand)
+    ),
+}
+
+
+def order_field(cls, order_by: str) -> Tuple[str, bool]:
+    """Split `order_by` into an attribute name and a descending flag
+
+    `"created_at"` sorts by ascending creation date and `"-created_at"`
+    by descending one. Private attributes (`_password`) cannot be sorted
+    by: the order would leak their values.
+    """
+    descending = order_by.startswith("-")
+    field = order_by[1:] if descending else order_by
+    if field.startswith("_") or field not in cls._fields:
+        raise AttributeError(
+            "'{}' object has no attribute '{}'".format(cls.__name__, field)
+        )
+    return field, descending
+
+
+def sort_key(field: str) -> Callable[[TypeVar("Base")], tuple]:
+    """Sort key on an attribute, ties broken by ID
+
+    Objects without value come first, like NULLs in SQL. Values of
+    different types, which may not compare, are grouped by type name.
+    """
+
+    def _key(obj):
+        value = getattr(obj, field)
+        return (value is not None, type(value).__name__, value, obj.id)
+
+    return _key
+
+
+def predicates(attributes: dict) -> List[Tuple[str, str, object]]:
+    """Split search attributes into (attribute, operator, operand)
+
+    A plain value is an equality test; a dict maps operators to operands:
+    `{"created_at": {"gt": t}}`, `{"email": {"startswith": "bob"}}`,
+    `{"created_at": {"between": (t1, t2)}}`.
+    """
+    result = []
+    for k, v in attributes.items():
+        if type(v) is not dict:
+            result.append((k, "eq", v))
+            continue
+        for op, operand in v.items():
+            if op not in OPERATORS:
+                raise ValueError("Unknown operator: {}".format(op))
+            if op == "between":
+                low, high = operand
+                operand = (low, high)
+            result.append((k, op, operand))
+    return result
+
+
+def matcher(attributes: dict) -> Callable[[TypeVar("Base")], bool]:
+    """Predicate selecting the objects with matching attributes"""
+    tests = [
+        (k, OPERATORS[op], operand)
+        for k, op, operand in predicates(attributes)
+    ]
+
+    def _search(obj):
+        for k, test, operand in tests:
+            if not test(getattr(obj, k), operand):
+                return False
+        return True
+
+    return _search
+
+
+def paginate(
+    cls,
+    objs: Iterable[TypeVar("Base")],
+    by_id: dict,
+    limit: int = None,
+    offset: int = 0,
+    order_by: str = None,
+    after: str = None,
+) -> Iterator[TypeVar("Base")]:
+    """Apply ordering, cursor and paging to matching objects
+
+    Without `order_by` objects stay in storage order and are consumed only
+    as far as the requested page goes. With `order_by` and a `limit`, only
+    the `offset + limit` first objects are kept in a heap.
+    """
+    if order_by is None:
+        if after is not None:
+            objs = dropwhile(lambda obj: obj.id != after, objs)
+            if next(objs, None) is None:
+                return iter(())
+    else:
+        field, descending = order_field(cls, order_by)
+        key = sort_key(field)
+        if after is not None:
+            cursor = by_id.get(after)
+            if cursor is None:
+                return iter(())
+            cursor_key = key(cursor)
+            if descending:
+                objs = (obj for obj in objs if key(obj) < cursor_key)
+            else:
+                objs = (obj for obj in objs if key(obj) > cursor_key)
+        if limit is None:
+            objs = sorted(objs, key=key, reverse=descending)
+        elif descending:
+            objs = heapq.nlargest(offset + limit, objs, key=key)
+        else:
+            objs = heapq.nsmallest(offset + limit, objs, key=key)
+
+    stop = None if limit is None else offset + limit
+    return islice(objs, offset, stop)
@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+""" SQLite storage engine
+"""
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from os import path
+from typing import Iterable, Iterator, List, Tuple, TypeVar
+
+from models.engine.file_storage import FileStorage
+from models.engine.index import prefix_successor
+from models.engine.query import order_field, predicates
+
+SQL_OPERATORS = {"eq": "=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+# Table of the number of rows of each model, kept by triggers
+COUNTS_TABLE = "_counts"
+
+
+def _quote(name: str) -> str:
+    """Quote an SQL identifier"""
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _literal(value: str) -> str:
+    """Quote an SQL string, for statements that take no parameter"""
+    return "'{}'".format(value.replace("'", "''"))
+
+
+class SQLiteStorage:
+    """Persist each model in its own table of an SQLite database
+
+    DATA stays the in-memory view of the models, but only as a read-through
+    cache: every read fetches the rows from the database, which other
+    processes may have changed, and reuses the cached object of a row only
+    while the row is the one it was built from. Every write goes straight
+    to the database.
+    """
+
+    def __init__(self, data: dict, db_path: str):
+        """Initialize the storage on top of the shared DATA dict"""
+        self.data = data
+        self.db_path = db_path
+        self._local = threading.local()
+        self._tables = set()
+        self._tables_lock = threading.Lock()
+        self._rows = {}
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Connection of the current thread"""
+        conn = getattr(self._local, "connection", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = conn
+        return conn
+
+    def _record(self, s_class: str, **counters):
+        """Add to the telemetry counters of a model
+
+        Counters whose name starts with `last_` are replaced instead.
+        """
+        with self._stats_lock:
+            stats = self._stats.setdefault(s_class, {})
+            for name, value in counters.items():
+                if name.startswith("last_"):
+                    stats[name] = value
+                else:
+                    stats[name] = stats.get(name, 0) + value
+
+    def _table(self, cls) -> str:
+        """Create the table of a model (and its indexes) if needed"""
+        s_class = cls.__name__
+        if s_class in self._tables:
+            return _quote(s_class)
+
+        with self._tables_lock:
+            if s_class not in self._tables:
+                self._create_table(cls)
+                self._create_counter(cls)
+                self._tables.add(s_class)
+                self._import_file(cls)
+        return _quote(s_class)
+
+    def _create_table(self, cls):
+        """Create or migrate the table of a model"""
+        s_class = cls.__name__
+        table = _quote(s_class)
+        conn = self.connection
+        columns = ", ".join(
+            "{} TEXT{}".format(
+                _quote(name), " PRIMARY KEY" if name == "id" else ""
+            )
+            for name in cls._fields
+        )
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS {} ({})".format(table, columns)
+            )
+            existing = {
+                row[1]
+                for row in conn.execute("PRAGMA table_info({})".format(table))
+            }
+            for name in cls._fields:
+                if name not in existing:
+                    conn.execute(
+                        "ALTER TABLE {} ADD COLUMN {} TEXT".format(
+                            table, _quote(name)
+                        )
+                    )
+                if name != "id":
+                    conn.execute(
+                        "CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(
+                            _quote("{}_{}".format(s_class, name)),
+                            table,
+                            _quote(name),
+                        )
+                    )
+
+    def _create_counter(self, cls):
+        """Count the rows of a model once, then keep the count up to date
+        with triggers, in every process writing the table"""
+        s_class = cls.__name__
+        table = _quote(s_class)
+        counts = _quote(COUNTS_TABLE)
+        conn = self.connection
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS {} "
+            "(name TEXT PRIMARY KEY, objects INTEGER NOT NULL)".format(counts)
+        )
+        # Counting and creating the triggers in one write transaction: no
+        # row is written in between
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            sql = "SELECT 1 FROM {} WHERE name = ?".format(counts)
+            if conn.execute(sql, (s_class,)).fetchone() is None:
+                for event, change in (("INSERT", "+ 1"), ("DELETE", "- 1")):
+                    conn.execute(
+                        "CREATE TRIGGER IF NOT EXISTS {} AFTER {} ON {} "
+                        "BEGIN UPDATE {} SET objects = objects {} "
+                        "WHERE name = {}; END".format(
+                            _quote("{}_count_{}".format(s_class, event)),
+                            event,
+                            table,
+                            counts,
+                            change,
+                            _literal(s_class),
+                        )
+                    )
+                conn.execute(
+                    "INSERT INTO {} (name, objects) "
+                    "SELECT ?, COUNT(*) FROM {}".format(counts, table),
+                    (s_class,),
+                )
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def _import_file(self, cls):
+        """Import the legacy `.db_<Class>.json` file (and its journal) into
+        an empty table"""
+        file_path = FileStorage.file_path(cls)
+        journal_path = FileStorage.journal_path(file_path)
+        if not path.exists(file_path) and not (
+            cls._journaled and path.exists(journal_path)
+        ):
+            return
+        table = _quote(cls.__name__)
+        conn = self.connection
+        if conn.execute("SELECT 1 FROM {} LIMIT 1".format(table)).fetchone():
+            return
+
+        objs_json = {}
+        if path.exists(file_path):
+            with open(file_path, "r") as f:
+                objs_json = json.load(f)
+        if cls._journaled:
+            _, entries = FileStorage._read_journal(journal_path)
+            FileStorage._replay(objs_json, entries)
+        self._upsert(
+            cls, (cls._from_json(obj_json) for obj_json in objs_json.values())
+        )
+
+    @staticmethod
+    def _column_value(value):
+        """Convert an attribute value to the value stored in its column"""
+        from models.base import TIMESTAMP_FORMAT
+
+        if type(value) is datetime:
+            return value.strftime(TIMESTAMP_FORMAT)
+        if type(value) is bytes:
+            return value.hex()
+        return value
+
+    def _upsert(self, cls, objs) -> List[tuple]:
+        """Insert or update objects of a model in one transaction, and
+        return their rows
+
+        An update keeps the row, unlike INSERT OR REPLACE which deletes it
+        without firing the triggers counting the rows.
+        """
+        fields = cls._fields
+        sql = (
+            "INSERT INTO {} ({}) VALUES ({}) "
+            "ON CONFLICT (id) DO UPDATE SET {}".format(
+                self._table(cls),
+                ", ".join(_quote(name) for name in fields),
+                ", ".join("?" for _ in fields),
+                ", ".join(
+                    "{0} = excluded.{0}".format(_quote(name))
+                    for name in fields
+                    if name != "id"
+                ),
+            )
+        )
+        rows = [
+            tuple(obj_json.get(name) for name in fields)
+            for obj_json in (obj.to_json(True) for obj in objs)
+        ]
+        start = time.perf_counter()
+        with self.connection as conn:
+            cursor = conn.executemany(sql, rows)
+        self._record(
+            cls.__name__,
+            writes=1,
+            rows_written=cursor.rowcount,
+            last_write_ms=(time.perf_counter() - start) * 1000,
+        )
+        return rows
+
+    def _cache(self, cls, objs: Iterable[TypeVar("Base")], rows: list):
+        """Cache objects with the rows they were saved as"""
+        s_class = cls.__name__
+        cached = self.data.setdefault(s_class, {})
+        cached_rows = self._rows.setdefault(s_class, {})
+        for obj, row in zip(objs, rows):
+            cached[obj.id] = obj
+            cached_rows[obj.id] = row
+
+    def _uncache(self, cls, ids: Iterable[str]):
+        """Drop objects from the cache"""
+        cached = self.data.get(cls.__name__, {})
+        cached_rows = self._rows.get(cls.__name__, {})
+        for obj_id in ids:
+            cached.pop(obj_id, None)
+            cached_rows.pop(obj_id, None)
+
+    def _cached(self, cls, row: tuple) -> TypeVar("Base"):
+        """Return the cached object of a fetched row, (re)building it if
+        the row changed since it was cached"""
+        s_class = cls.__name__
+        objs = self.data.setdefault(s_class, {})
+        rows = self._rows.setdefault(s_class, {})
+        obj = objs.get(row[0])
+        if obj is None or rows.get(row[0]) != row:
+            obj = cls._from_json(dict(zip(cls._fields, row)))
+            objs[obj.id] = obj
+            rows[obj.id] = row
+        return obj
+
+    def _select(self, cls) -> str:
+        """SELECT clause returning every field of a model, id first"""
+        return "SELECT {} FROM {}".format(
+            ", ".join(_quote(name) for name in cls._fields), self._table(cls)
+        )
+
+    def load(self, cls):
+        """Prepare the table of a model and reset its cache"""
+        start = time.perf_counter()
+        self._table(cls)
+        self.data[cls.__name__] = {}
+        self._rows[cls.__name__] = {}
+        self._record(
+            cls.__name__,
+            loads=1,
+            last_load_ms=(time.perf_counter() - start) * 1000,
+        )
+
+    def save_all(self, cls):
+        """Save all cached objects of a model"""
+        self._upsert(cls, list(self.data.get(cls.__name__, {}).values()))
+
+    def flush(self, cls=None):
+        """Nothing to do: every write is committed right away"""
+
+    def save(self, obj: TypeVar("Base")):
+        """Save one object"""
+        cls = obj.__class__
+        self._cache(cls, (obj,), self._upsert(cls, (obj,)))
+
+    def save_many(self, cls, objs: Iterable[TypeVar("Base")]):
+        """Save many objects of a model in one transaction"""
+        objs = list(objs)
+        self._cache(cls, objs, self._upsert(cls, objs))
+
+    def remove(self, obj: TypeVar("Base")):
+        """Remove one object"""
+        cls = obj.__class__
+        sql = "DELETE FROM {} WHERE id = ?".format(self._table(cls))
+        with self.connection as conn:
+            conn.execute(sql, (obj.id,))
+        self._uncache(cls, (obj.id,))
+
+    def remove_many(self, cls, objs: Iterable[TypeVar("Base")]):
+        """Remove many objects of a model in one transaction"""
+        ids = [obj.id for obj in objs]
+        sql = "DELETE FROM {} WHERE id = ?".format(self._table(cls))
+        start = time.perf_counter()
+        with self.connection as conn:
+            cursor = conn.executemany(sql, ((obj_id,) for obj_id in ids))
+        self._record(
+            cls.__name__,
+            writes=1,
+            rows_written=cursor.rowcount,
+            last_write_ms=(time.perf_counter() - start) * 1000,
+        )
+        self._uncache(cls, ids)
+
+    def _where(self, cls, attributes: dict) -> Tuple[List[str], list]:
+        """SQL conditions and parameters matching attributes"""
+        clauses = []
+        params = []
+        for k, op, operand in predicates(attributes or {}):
+            if k not in cls._fields:
+                raise AttributeError(
+                    "'{}' object has no attribute '{}'".format(
+                        cls.__name__, k
+                    )
+                )
+            column = _quote(k)
+            if op == "eq" and operand is None:
+                clauses.append("{} IS NULL".format(column))
+            elif op == "between":
+                clauses.append("{} BETWEEN ? AND ?".format(column))
+                params.extend(self._column_value(v) for v in operand)
+            elif op == "startswith":
+                # A range on the prefix keeps the index usable, unlike LIKE
+                clauses.append("{} >= ?".format(column))
+                params.append(operand)
+                successor = prefix_successor(operand)
+                if successor is not None:
+                    clauses.append("{} < ?".format(column))
+                    params.append(successor)
+            else:
+                clauses.append("{} {} ?".format(column, SQL_OPERATORS[op]))
+                params.append(self._column_value(operand))
+        return clauses, params
+
+    def _cursor_where(
+        self, cls, field: str, descending: bool, after: str
+    ) -> Tuple[str, list]:
+        """SQL condition selecting the rows ordered after a cursor object"""
+        if field is None:
+            return (
+                "rowid > (SELECT rowid FROM {} WHERE id = ?)".format(
+                    self._table(cls)
+                ),
+                [after],
+            )
+
+        sql = "SELECT {} FROM {} WHERE id = ?".format(
+            _quote(field), self._table(cls)
+        )
+        row = self.connection.execute(sql, (after,)).fetchone()
+        if row is None:
+            return "0", []
+
+        column = _quote(field)
+        value = row[0]
+        if value is None and descending:
+            return "({0} IS NULL AND id < ?)".format(column), [after]
+        if value is None:
+            return (
+                "({0} IS NOT NULL OR id > ?)".format(column),
+                [after],
+            )
+        if descending:
+            return (
+                "({0} IS NULL OR {0} < ? OR ({0} = ? AND id < ?))".format(
+                    column
+                ),
+                [value, value, after],
+            )
+        return (
+            "({0} > ? OR ({0} = ? AND id > ?))".format(column),
+            [value, value, after],
+        )
+
+    def stats(self, cls) -> dict:
+        """Telemetry of a model, from the counters kept by the storage
+
+        - objects: rows of the table, counted by triggers; cached: objects
+          in DATA
+        - file_bytes: size of the database and its WAL, shared by models
+        - loads, last_load_ms: table setups and the last one's duration
+        - writes, rows_written, last_write_ms: write transactions
+        - index_hits: searches filtering on a column, every column being
+          indexed
+        """
+        s_class = cls.__name__
+        file_bytes = 0
+        for suffix in ("", "-wal"):
+            try:
+                file_bytes += path.getsize(self.db_path + suffix)
+            except OSError:
+                pass
+        result = {
+            "objects": self.count(cls),
+            "cached": len(self.data.get(s_class, {}).keys()),
+            "file_bytes": file_bytes,
+            "loads": 0,
+            "last_load_ms": None,
+            "writes": 0,
+            "rows_written": 0,
+            "last_write_ms": None,
+            "index_hits": 0,
+        }
+        with self._stats_lock:
+            result.update(self._stats.get(s_class, {}))
+        return result
+
+    def count(self, cls, attributes: dict = None) -> int:
+        """Count all objects of a model, or the ones matching attributes
+
+        All objects are counted by the triggers of the table.
+        """
+        clauses, params = self._where(cls, attributes)
+        if not clauses:
+            self._table(cls)
+            sql = "SELECT objects FROM {} WHERE name = ?".format(
+                _quote(COUNTS_TABLE)
+            )
+            return self.connection.execute(sql, (cls.__name__,)).fetchone()[0]
+        sql = "SELECT COUNT(*) FROM {}".format(self._table(cls))
+        if clauses:
+            sql = "{} WHERE {}".format(sql, " AND ".join(clauses))
+        return self.connection.execute(sql, params).fetchone()[0]
+
+    def get(self, cls, id: str) -> TypeVar("Base"):
+        """Return one object by ID, as the database holds it now"""
+        sql = "{} WHERE id = ?".format(self._select(cls))
+        row = self.connection.execute(sql, (id,)).fetchone()
+        if row is None:
+            # Removed, maybe by another process
+            self._uncache(cls, (id,))
+            return None
+        return self._cached(cls, row)
+
+    def iter_search(
+        self,
+        cls,
+        attributes: dict,
+        limit: int = None,
+        offset: int = 0,
+        order_by: str = None,
+        after: str = None,
+    ) -> Iterator[TypeVar("Base")]:
+        """Lazily iterate over the objects with matching attributes"""
+        clauses, params = self._where(cls, attributes)
+        if clauses:
+            self._record(cls.__name__, index_hits=1)
+        field, descending = None, False
+        if order_by is not None:
+            field, descending = order_field(cls, order_by)
+        if after is not None:
+            clause, cursor_params = self._cursor_where(
+                cls, field, descending, after
+            )
+            clauses.append(clause)
+            params.extend(cursor_params)
+
+        sql = self._select(cls)
+        if clauses:
+            sql = "{} WHERE {}".format(sql, " AND ".join(clauses))
+        if field is None:
+            sql = "{} ORDER BY rowid".format(sql)
+        else:
+            direction = " DESC" if descending else ""
+            sql = "{0} ORDER BY {1}{2}, id{2}".format(
+                sql, _quote(field), direction
+            )
+        if limit is not None or offset:
+            sql = "{} LIMIT ? OFFSET ?".format(sql)
+            params.extend([-1 if limit is None else limit, offset])
+
+        for row in self.connection.execute(sql, params):
+            yield self._cached(cls, row)
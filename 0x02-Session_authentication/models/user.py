@@ -5,16 +5,31 @@ import hashlib
 from models.base import Base
 
 
+def _digest_from_hex(pwd_hex: str):
+    """ Store a SHA256 hex digest as its 32 raw bytes
+    """
+    if type(pwd_hex) is not str:
+        return pwd_hex
+    try:
+        return bytes.fromhex(pwd_hex)
+    except ValueError:
+        return pwd_hex
+
+
 class User(Base):
     """ User class
     """
 
+    __slots__ = ("email", "_password", "first_name", "last_name")
+    _decoders = dict(Base._decoders, _password=_digest_from_hex)
+    _indexes = Base._indexes + ("email",)
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a User instance
         """
         super().__init__(*args, **kwargs)
         self.email = kwargs.get('email')
-        self._password = kwargs.get('_password')
+        self._password = _digest_from_hex(kwargs.get('_password'))
         self.first_name = kwargs.get('first_name')
         self.last_name = kwargs.get('last_name')
 
@@ -22,6 +37,8 @@ class User(Base):
     def password(self) -> str:
         """ Getter of the password
         """
+        if type(self._password) is bytes:
+            return self._password.hex()
         return self._password
 
     @password.setter
@@ -31,7 +48,7 @@ class User(Base):
         if pwd is None or type(pwd) is not str:
             self._password = None
         else:
-            self._password = hashlib.sha256(pwd.encode()).hexdigest().lower()
+            self._password = hashlib.sha256(pwd.encode()).digest()
 
     def is_valid_password(self, pwd: str) -> bool:
         """ Validate a password
@@ -41,6 +58,8 @@ class User(Base):
         if self.password is None:
             return False
         pwd_e = pwd.encode()
+        if type(self._password) is bytes:
+            return hashlib.sha256(pwd_e).digest() == self._password
         return hashlib.sha256(pwd_e).hexdigest().lower() == self.password
 
     def display_name(self) -> str:
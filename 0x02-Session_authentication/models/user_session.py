@@ -8,6 +8,11 @@ from models.base import Base
 class UserSession(Base):
     """UserSession class"""
 
+    __slots__ = ("user_id", "session_id")
+    _indexes = Base._indexes + ("user_id",)
+    # Sessions are created and destroyed one by one, all the time
+    _journaled = True
+
     def __init__(self, *args: list, **kwargs: dict):
         """Initialize a User instance"""
         super().__init__(*args, **kwargs)